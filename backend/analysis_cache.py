@@ -0,0 +1,336 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class CachedResult:
+    """Analyzer result restored from the cache, with the fields the app reads"""
+
+    __slots__ = ("entity_type", "start", "end", "score")
+
+    def __init__(self, entity_type, start, end, score):
+        self.entity_type = entity_type
+        self.start = start
+        self.end = end
+        self.score = score
+
+    def __repr__(self):
+        return f"CachedResult({self.entity_type}, {self.start}, {self.end}, {self.score})"
+
+
+class AnalysisCache:
+    """
+    Bounded cache of analyzer results keyed by a hash of the analysis inputs.
+
+    Entries are evicted least-recently-used once either max_entries or
+    max_bytes is exceeded, and expire after ttl_seconds. When cache_dir is
+    set, entries are also written there as JSON files so they survive a
+    restart. The directory has its own max_disk_entries/max_disk_bytes
+    limits: once either is exceeded, a sweep removes expired files and then
+    the least recently used ones until it is back under a fraction of them.
+    The directory is created and swept on first use, not on construction,
+    since the app (and so this cache) is also imported by shard processes.
+    """
+
+    # A sweep goes down to this fraction of the disk limits, so it runs rarely
+    DISK_SWEEP_TARGET = 0.9
+
+    # Temporary files older than this are left over from interrupted writes
+    STALE_TMP_SECONDS = 300
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl_seconds=3600, cache_dir=None,
+                 max_disk_entries=16384, max_disk_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        # key -> (expires_at, results, size_bytes)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Approximate size of the disk backend; each sweep recounts it exactly
+        self._disk_lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self.disk_entries = 0
+        self.disk_bytes = 0
+        self.disk_evictions = 0
+        self._disk_ready = False
+        self._disk_ready_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text, language, entities=None, mode=""):
+        """Hash of the text, language, requested entity set and detection mode"""
+        entity_part = ",".join(sorted(entities)) if entities else "*"
+        digest = hashlib.sha256()
+        for part in (mode, language, entity_part):
+            digest.update(part.encode("utf-8", "surrogatepass"))
+            digest.update(b"\0")
+        # surrogatepass: text from a JSON request can contain lone surrogates
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _serialize(results):
+        return [(r.entity_type, int(r.start), int(r.end), float(r.score)) for r in results]
+
+    @staticmethod
+    def _restore(rows):
+        return [CachedResult(*row) for row in rows]
+
+    @staticmethod
+    def _estimate_size(key, rows):
+        """Approximate memory held by an entry"""
+        size = sys.getsizeof(key) + sys.getsizeof(rows)
+        for row in rows:
+            size += sys.getsizeof(row) + sys.getsizeof(row[0]) + 3 * 32
+        return size
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _prepare_disk(self):
+        """Create cache_dir and sweep it the first time the disk backend is used"""
+        if self._disk_ready:
+            return
+        with self._disk_ready_lock:
+            if self._disk_ready:
+                return
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                print(f"Warning: Could not create analysis cache directory: {e}")
+            self._sweep_disk()
+            self._disk_ready = True
+
+    def _disk_files(self):
+        """(path, size, mtime) of every cache file in cache_dir, including temporary files"""
+        files = []
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith((".json", ".tmp")):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((entry.path, stat.st_size, stat.st_mtime))
+        except OSError as e:
+            print(f"Warning: Could not list analysis cache directory: {e}")
+        return files
+
+    def _remove_disk_file(self, path, size):
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        with self._disk_lock:
+            self.disk_entries -= 1
+            self.disk_bytes -= size
+        return True
+
+    def _sweep_disk(self):
+        """
+        Recount the disk backend and, if it is over its limits, remove expired
+        files and then the least recently used ones (oldest mtime first; reads
+        refresh the mtime) until it is under DISK_SWEEP_TARGET of them.
+        Temporary files count towards the limits; those older than
+        STALE_TMP_SECONDS are always removed, newer ones may still be written.
+        """
+        if not self._sweep_lock.acquire(blocking=False):
+            # Another thread is already sweeping
+            return
+        try:
+            self._sweep_disk_locked()
+        finally:
+            self._sweep_lock.release()
+
+    def _sweep_disk_locked(self):
+        files = self._disk_files()
+
+        # Temporary files of writes that never finished are always removed
+        stale_before = time.time() - self.STALE_TMP_SECONDS
+        stale = [file for file in files if file[0].endswith(".tmp") and file[2] < stale_before]
+        if stale:
+            files = [file for file in files if file not in stale]
+            for path, _, _ in stale:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        with self._disk_lock:
+            self.disk_entries = len(files)
+            self.disk_bytes = sum(size for _, size, _ in files)
+            if self.disk_entries <= self.max_disk_entries and self.disk_bytes <= self.max_disk_bytes:
+                return
+
+        target_entries = int(self.max_disk_entries * self.DISK_SWEEP_TARGET)
+        target_bytes = int(self.max_disk_bytes * self.DISK_SWEEP_TARGET)
+        # A file untouched for ttl_seconds was written even earlier, so it has expired
+        expired_before = time.time() - self.ttl_seconds
+        files.sort(key=lambda file: file[2])
+
+        removed = 0
+        for path, size, mtime in files:
+            if path.endswith(".tmp"):
+                continue
+            under_limit = self.disk_entries <= target_entries and self.disk_bytes <= target_bytes
+            if under_limit and mtime > expired_before:
+                break
+            if self._remove_disk_file(path, size):
+                removed += 1
+        with self._disk_lock:
+            self.disk_evictions += removed
+
+    def get(self, key):
+        """Return cached results for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, rows, size = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._restore(rows)
+                self._remove(key)
+
+        disk_entry = self._read_disk(key, now)
+        with self._lock:
+            if disk_entry is None:
+                self.misses += 1
+                return None
+            expires_at, rows = disk_entry
+            self.hits += 1
+            self._store(key, rows, expires_at)
+        return self._restore(rows)
+
+    def put(self, key, results):
+        """Cache analyzer results for key"""
+        rows = self._serialize(results)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, rows, expires_at)
+        self._write_disk(key, rows, expires_at)
+
+    def get_or_analyze(self, key, analyze):
+        """Return cached results, calling analyze() and caching its results on a miss"""
+        results = self.get(key)
+        if results is None:
+            results = analyze()
+            self.put(key, results)
+        return results
+
+    def _store(self, key, rows, expires_at):
+        if key in self._entries:
+            self._remove(key)
+
+        size = self._estimate_size(key, rows)
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (expires_at, rows, size)
+        self.current_bytes += size
+
+        while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def _read_disk(self, key, now):
+        if not self.cache_dir:
+            return None
+        self._prepare_disk()
+
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        expires_at = data.get("expires_at", 0)
+        if expires_at <= now:
+            try:
+                self._remove_disk_file(path, os.path.getsize(path))
+            except OSError:
+                pass
+            return None
+
+        try:
+            # Mark the file as recently used for the sweep
+            os.utime(path)
+        except OSError:
+            pass
+        return expires_at, [tuple(row) for row in data["results"]]
+
+    def _write_disk(self, key, rows, expires_at):
+        if not self.cache_dir:
+            return
+        self._prepare_disk()
+
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            replaced_size = os.path.getsize(path) if os.path.exists(path) else None
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "results": rows}, f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not write analysis cache entry: {e}")
+            return
+
+        with self._disk_lock:
+            if replaced_size is None:
+                self.disk_entries += 1
+                self.disk_bytes += size
+            else:
+                self.disk_bytes += size - replaced_size
+            over_limit = self.disk_entries > self.max_disk_entries or self.disk_bytes > self.max_disk_bytes
+        if over_limit:
+            self._sweep_disk()
+
+    def clear(self):
+        """Drop all entries, in memory and on disk"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+        if self.cache_dir:
+            self._prepare_disk()
+            for path, size, _ in self._disk_files():
+                self._remove_disk_file(path, size)
+
+    def stats(self):
+        """Cache counters for health reporting"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_backend": bool(self.cache_dir),
+                "disk_entries": self.disk_entries,
+                "disk_bytes": self.disk_bytes,
+                "disk_evictions": self.disk_evictions,
+            }
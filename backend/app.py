@@ -1,17 +1,317 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
-from presidio_analyzer import AnalyzerEngine
 from deprivacy_replacer import DeprivacyReplacer
+from sharded_replacer import ShardedReplacer
+from gazetteer_detector import GazetteerDetector, merge_results
+from analysis_cache import AnalysisCache
+from model_registry import ModelRegistry
+from request_profiler import RequestProfiler
+import hashlib
+import hmac
+import json
+import math
+import os
 import re
+import sys
+import threading
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})  # Enable CORS for all routes
+# Enable CORS for all routes except /admin/*, which browsers must not reach cross-origin.
+# Only Content-Type may be sent cross-origin, so pages cannot set X-Profile
+# or X-Admin-Token
+CORS(app, resources={r"^/(?!admin/).*": {"origins": "*"}}, allow_headers=["Content-Type"])
+
+# The Presidio analyzer (spaCy) and the replacer take a long time to load, so
+# nothing heavy happens at import: both are loaded in the background once the
+# server starts (or on the first request) and /health answers immediately.
+# Created by get_analyzer()
+analyzer = None
+analyzer_lock = threading.Lock()
+loading_lock = threading.Lock()
+loading_started = False
+
+# The replacer is held in a versioned registry so new embeddings/clusters
+# can be loaded in the background and swapped in without a restart
+# DEPRIVACY_REPLACEMENT_PLAN_DIR points at alias tables compiled for this
+# epsilon with replacement_plan.py. DEPRIVACY_NUM_SHARDS > 1 splits the
+# model across that many local shard processes.
+DEFAULT_MODEL_CONFIG = {
+    'epsilon': 20.0,
+    'plan_dir': os.environ.get('DEPRIVACY_REPLACEMENT_PLAN_DIR'),
+    'num_shards': int(os.environ.get('DEPRIVACY_NUM_SHARDS', '0'))
+}
+
+
+def build_replacer(num_shards=0, **config):
+    """Single-process replacer, or a router over shard processes when num_shards > 1."""
+    if num_shards and num_shards > 1:
+        return ShardedReplacer(num_shards=num_shards, **config)
+    return DeprivacyReplacer(**config)
+
+
+registry = ModelRegistry(build_replacer)
+
+# /admin/reload only loads clusters, embeddings and plans from inside this
+# directory, and starts at most DEPRIVACY_MAX_SHARDS shard processes
+MODEL_DIR = os.environ.get('DEPRIVACY_MODEL_DIR')
+MAX_SHARDS = int(os.environ.get('DEPRIVACY_MAX_SHARDS', str(os.cpu_count() or 1)))
+MODEL_PATH_KEYS = ('clusters_file', 'embeddings_file', 'plan_dir')
+
+# Endpoints that cannot answer until a model version is loaded
+MODEL_ENDPOINTS = {'deprivatize', 'test_replacement', 'replacement_distribution'}
+
+# Presidio results for recently analyzed texts, so pressing the button again
+# on the same textareas skips spaCy. Set DEPRIVACY_ANALYSIS_CACHE_DIR to also
+# keep entries on disk across restarts.
+analysis_cache = AnalysisCache(
+    max_entries=1024,
+    max_bytes=16 * 1024 * 1024,
+    ttl_seconds=3600,
+    cache_dir=os.environ.get('DEPRIVACY_ANALYSIS_CACHE_DIR'),
+    max_disk_entries=16384,
+    max_disk_bytes=256 * 1024 * 1024
+)
+
+# Opt-in profiling: admins send "X-Profile: 1" with their X-Admin-Token to get
+# a summary of the request's hottest functions in the response.
+# DEPRIVACY_PROFILE_SAMPLE_EVERY=N also profiles every N-th request (without
+# returning the summary), and DEPRIVACY_PROFILE_DIR keeps the traces.
+request_profiler = RequestProfiler(
+    sample_every=int(os.environ.get('DEPRIVACY_PROFILE_SAMPLE_EVERY', '0')),
+    output_dir=os.environ.get('DEPRIVACY_PROFILE_DIR')
+)
+
+# Entity types we want to replace
+TARGET_ENTITY_TYPES = {'LOCATION', 'PERSON', 'NRP', GazetteerDetector.ENTITY_TYPE}
+
+# "presidio": full Presidio analysis (default)
+# "gazetteer": vocabulary scan only, lowest latency
+# "hybrid": vocabulary scan, then Presidio as a second pass
+DETECTION_MODES = {'presidio', 'gazetteer', 'hybrid'}
+
+# "full": return the whole processed_text (default)
+# "edits": return only the replaced spans, for clients that patch the text locally
+RESPONSE_MODES = {'full', 'edits'}
+
+print("Flask app initialized")
+
+
+def get_analyzer():
+    """Create the Presidio analyzer on first use."""
+    global analyzer
+    if analyzer is None:
+        with analyzer_lock:
+            if analyzer is None:
+                from presidio_analyzer import AnalyzerEngine
+                analyzer = AnalyzerEngine()
+                print("Presidio analyzer ready")
+    return analyzer
+
+
+def start_background_loading():
+    """Load the analyzer and the first model version without blocking (once)."""
+    global loading_started
+    with loading_lock:
+        if loading_started:
+            return
+        loading_started = True
+
+    print("Loading Presidio analyzer and Deprivacy replacer in the background")
+    threading.Thread(target=get_analyzer, name="analyzer-load", daemon=True).start()
+    registry.load_async(**DEFAULT_MODEL_CONFIG)
+
+
+def is_admin_request():
+    """
+    Admin features require the X-Admin-Token header to match
+    DEPRIVACY_ADMIN_TOKEN; they are disabled when no token is configured.
+    The client address is not trusted: the extension user's own browser is
+    a loopback client too, and would run requests from any page it visits.
+    """
+    admin_token = os.environ.get('DEPRIVACY_ADMIN_TOKEN')
+    if not admin_token:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token)
+
+
+def resolve_model_path(path):
+    """
+    Absolute path of a model file or directory requested through
+    /admin/reload, or None if it is not inside DEPRIVACY_MODEL_DIR.
+    """
+    if not MODEL_DIR or not isinstance(path, str) or not path:
+        return None
+    model_dir = os.path.realpath(MODEL_DIR)
+    resolved = os.path.realpath(os.path.join(model_dir, path))
+    if os.path.commonpath([model_dir, resolved]) != model_dir:
+        return None
+    return resolved
+
+
+@app.before_request
+def retain_model():
+    """Pin the active model version for the whole request."""
+    if not loading_started:
+        start_background_loading()
+    g.model = registry.retain()
+    if g.model is None and request.endpoint in MODEL_ENDPOINTS:
+        return jsonify({
+            "success": False,
+            "error": "Model is still loading"
+        }), 503
+
+
+@app.teardown_request
+def release_model(exc):
+    model = g.pop('model', None)
+    if model is not None:
+        registry.release(model)
+
+
+@app.before_request
+def start_profiling():
+    """Profile this request if an admin asked for it or it is sampled."""
+    explicit = request.headers.get('X-Profile') == '1' and is_admin_request()
+    if explicit or request_profiler.should_sample():
+        g.profile = request_profiler.start()
+        g.profile_explicit = explicit
+
+
+@app.after_request
+def finish_profiling(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+
+    summary = request_profiler.stop(profile)
+    saved_path = request_profiler.save(profile, summary, request.endpoint or 'request')
+    print(f"Profiled {request.path} in {summary['elapsed_seconds']:.3f}s"
+          + (f", saved to {saved_path}" if saved_path else ""))
+
+    if g.get('profile_explicit') and response.is_json:
+        body = response.get_json()
+        if isinstance(body, dict):
+            body['profile'] = summary
+            response.set_data(json.dumps(body))
+    return response
+
+
+@app.teardown_request
+def abort_profiling(exc):
+    """Stop a profile that after_request did not get to (unhandled errors)."""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        request_profiler.stop(profile)
+
+
+def build_gazetteer(replacer):
+    """Compile the gazetteer from a replacer's clustered vocabulary."""
+    words = (word for cluster_words in replacer.clusters.values() for word in cluster_words)
+    gazetteer = GazetteerDetector(words)
+    print(f"Gazetteer compiled with {gazetteer.num_words} words")
+    return gazetteer
+
+
+def get_gazetteer():
+    """Gazetteer of the request's model version, compiled on first use."""
+    if g.model is None:
+        raise RuntimeError("Model is still loading")
+    return g.model.get_extra('gazetteer', build_gazetteer)
+
+
+def analyze_cached(text, language='en', entities=None):
+    """Run the Presidio analyzer, reusing cached results for identical inputs."""
+    key = AnalysisCache.make_key(text, language, entities, mode='presidio')
+    return analysis_cache.get_or_analyze(
+        key, lambda: get_analyzer().analyze(text=text, language=language, entities=entities)
+    )
+
+
+def detect_entities(text, detection_mode='presidio'):
+    """Run entity detection on text with the requested detection mode."""
+    if detection_mode == 'presidio':
+        return analyze_cached(text)
+
+    results = get_gazetteer().analyze(text)
+    if detection_mode == 'hybrid':
+        results = merge_results(results, analyze_cached(text))
+    return results
+
+
+def is_number(value):
+    """True for finite JSON numbers (bool is an int subclass, but not a number here)."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def content_hash(text):
+    """
+    SHA-256 of the UTF-8 text, used by clients to check they patch the same text.
+
+    A JSON string from JavaScript can contain lone surrogates, which UTF-8
+    cannot encode; like the browser's TextEncoder, they are hashed as U+FFFD.
+    """
+    well_formed = text.encode('utf-16-le', 'surrogatepass').decode('utf-16-le', 'replace')
+    return hashlib.sha256(well_formed.encode('utf-8')).hexdigest()
+
 
-# Initialize the Presidio analyzer and Deprivacy replacer
-analyzer = AnalyzerEngine()
-replacer = DeprivacyReplacer(epsilon=20.0)
+def to_utf16_offsets(text, positions):
+    """
+    Convert code point offsets into UTF-16 code unit offsets (JavaScript string indices).
 
-print("Flask app initialized with Presidio analyzer and Deprivacy replacer")
+    Args:
+        text (str): The text the positions refer to
+        positions (list): Ascending code point offsets
+
+    Returns:
+        list: The same positions counted in UTF-16 code units
+    """
+    if text.isascii():
+        return list(positions)
+
+    converted = []
+    previous = 0
+    shift = 0
+    for position in positions:
+        shift += sum(1 for char in text[previous:position] if ord(char) > 0xFFFF)
+        converted.append(position + shift)
+        previous = position
+    return converted
+
+
+def apply_edits(text, edits):
+    """Apply ascending, non-overlapping (start, end, replacement) edits to text."""
+    parts = []
+    last_end = 0
+    for start, end, replacement in edits:
+        parts.append(text[last_end:start])
+        parts.append(replacement)
+        last_end = end
+    parts.append(text[last_end:])
+    return ''.join(parts)
+
+
+def text_payload(original_text, edits, response_mode):
+    """
+    Build the text part of a /deprivatize response.
+
+    In "edits" mode the edits are returned with start/end offsets into the
+    original text in UTF-16 code units, so they can be applied directly to a
+    JavaScript string, together with the hash of the original text.
+    """
+    if response_mode == 'full':
+        return {"processed_text": apply_edits(original_text, edits)}
+
+    offsets = to_utf16_offsets(
+        original_text, [offset for start, end, _ in edits for offset in (start, end)]
+    )
+    return {
+        "content_hash": content_hash(original_text),
+        "offset_units": "utf-16",
+        "edits": [
+            {"start": offsets[2 * i], "end": offsets[2 * i + 1], "replacement": replacement}
+            for i, (_, _, replacement) in enumerate(edits)
+        ]
+    }
 
 
 @app.route('/deprivatize', methods=['POST'])
@@ -30,25 +330,39 @@ def deprivatize():
 
         original_text = data.get('text', '')
         epsilon = data.get('epsilon', 20.0)
-        
+        detection_mode = data.get('detection_mode', 'presidio')
+        response_mode = data.get('response_mode', 'full')
+
+        if detection_mode not in DETECTION_MODES:
+            return jsonify({
+                "success": False,
+                "error": f"Unknown detection_mode: {detection_mode}"
+            }), 400
+
+        if response_mode not in RESPONSE_MODES:
+            return jsonify({
+                "success": False,
+                "error": f"Unknown response_mode: {response_mode}"
+            }), 400
+
         if not original_text.strip():
             return jsonify({
                 "success": True,
-                "processed_text": original_text,
+                **text_payload(original_text, [], response_mode),
                 "entities_found": 0,
                 "entities_replaced": 0
             })
 
-        print(f"Processing text (length: {len(original_text)}) with epsilon: {epsilon}")
+        print(f"Processing text (length: {len(original_text)}) with epsilon: {epsilon}, "
+              f"detection mode: {detection_mode}")
+
+        # Step 1: Detect PII entities
+        analysis_results = detect_entities(original_text, detection_mode)
 
-        # Step 1: Detect PII entities using Presidio
-        analysis_results = analyzer.analyze(text=original_text, language='en')
-        
         # Filter for specific entity types we want to replace
-        target_entity_types = {'LOCATION', 'PERSON', 'NRP'}
         relevant_entities = [
-            result for result in analysis_results 
-            if result.entity_type in target_entity_types
+            result for result in analysis_results
+            if result.entity_type in TARGET_ENTITY_TYPES
         ]
 
         print(f"Found {len(relevant_entities)} relevant PII entities")
@@ -56,21 +370,26 @@ def deprivatize():
         if not relevant_entities:
             return jsonify({
                 "success": True,
-                "processed_text": original_text,
+                **text_payload(original_text, [], response_mode),
                 "entities_found": 0,
                 "entities_replaced": 0,
                 "message": "No PII entities found"
             })
 
-        # Step 2: Sort entities by position (reverse order to maintain text positions)
-        relevant_entities.sort(key=lambda x: x.start, reverse=True)
+        # Step 2: Sort entities by position
+        relevant_entities.sort(key=lambda x: x.start)
 
-        # Step 3: Replace entities one by one
-        processed_text = original_text
+        # Step 3: Choose a replacement for each entity
+        replacer = g.model.replacer
+        edits = []
         entities_replaced = 0
         replacement_log = []
 
         for entity in relevant_entities:
+            if edits and entity.start < edits[-1][1]:
+                print(f"Skipping {entity.entity_type} at {entity.start}-{entity.end}: overlaps a replaced entity")
+                continue
+
             entity_text = original_text[entity.start:entity.end]
             print(f"Processing {entity.entity_type}: '{entity_text}'")
 
@@ -80,13 +399,8 @@ def deprivatize():
             if replacement_result[0] is not None:  # replacement_word is not None
                 replacement_word, target_cluster, selected_cluster = replacement_result
                 
-                # Replace the entity in the text
-                processed_text = (
-                    processed_text[:entity.start] + 
-                    replacement_word + 
-                    processed_text[entity.end:]
-                )
-                
+                edits.append((entity.start, entity.end, str(replacement_word)))
+
                 entities_replaced += 1
                 cluster_info = "same cluster" if target_cluster == selected_cluster else "different cluster"
                 
@@ -115,7 +429,7 @@ def deprivatize():
 
         return jsonify({
             "success": True,
-            "processed_text": processed_text,
+            **text_payload(original_text, edits, response_mode),
             "entities_found": len(relevant_entities),
             "entities_replaced": entities_replaced,
             "epsilon_used": epsilon,
@@ -141,10 +455,13 @@ def detect_pii():
             return jsonify({"entities": []})
             
         text = data.get('text', '')
+        detection_mode = data.get('detection_mode', 'presidio')
+        if detection_mode not in DETECTION_MODES:
+            return jsonify({"entities": []})
         print(f"Received text for PII detection: {text}")
 
         # Analyze the text for PII entities
-        analysis_results = analyzer.analyze(text=text, language='en')
+        analysis_results = detect_entities(text, detection_mode)
 
         # Build response entities list
         entities = []
@@ -167,16 +484,107 @@ def detect_pii():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint."""
+    """Health check endpoint. Cheap enough for liveness probes: it never waits for models."""
+    replacer = g.model.replacer if g.model else None
+    model_healthy = replacer is None or replacer.healthy
     return jsonify({
-        "status": "healthy",
+        "status": "healthy" if model_healthy else "degraded",
         "analyzer_ready": analyzer is not None,
+        "gazetteer_ready": g.model is not None and 'gazetteer' in g.model.extras,
+        "analysis_cache": analysis_cache.stats(),
         "replacer_ready": replacer is not None,
+        "model": registry.status(),
         "clusters_loaded": len(replacer.clusters) if replacer else 0,
-        "embeddings_loaded": len(replacer.embeddings) if replacer else 0
+        "embeddings_loaded": replacer.num_embeddings if replacer else 0,
+        "shards": len(getattr(replacer, 'shards', [])) if replacer else 0,
+        "failed_shards": getattr(replacer, 'failed_shards', {}) if replacer else {}
     })
 
 
+@app.route('/admin/reload', methods=['POST'])
+def reload_model():
+    """
+    Build a new model version in the background and swap it in when ready.
+    Requests already in flight finish on the version they started with.
+
+    Requires X-Admin-Token. clusters_file, embeddings_file and plan_dir are
+    resolved relative to DEPRIVACY_MODEL_DIR and must stay inside it.
+    """
+    if not os.environ.get('DEPRIVACY_ADMIN_TOKEN'):
+        return jsonify({
+            "success": False,
+            "error": "Admin endpoints are disabled; set DEPRIVACY_ADMIN_TOKEN to enable them"
+        }), 403
+
+    if not is_admin_request():
+        return jsonify({
+            "success": False,
+            "error": "Admin access required"
+        }), 403
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    inherited = g.model.config if g.model else DEFAULT_MODEL_CONFIG
+    config = dict(inherited)
+
+    for key in MODEL_PATH_KEYS:
+        if key not in data:
+            continue
+        path = resolve_model_path(data[key])
+        if path is None:
+            return jsonify({
+                "success": False,
+                "error": f"{key} must be a path inside DEPRIVACY_MODEL_DIR"
+                         + ("" if MODEL_DIR else " (not configured)")
+            }), 400
+        config[key] = path
+
+    if 'epsilon' in data:
+        if not is_number(data['epsilon']) or data['epsilon'] <= 0:
+            return jsonify({
+                "success": False,
+                "error": "epsilon must be a positive number"
+            }), 400
+        config['epsilon'] = float(data['epsilon'])
+
+    if 'num_shards' in data:
+        num_shards = data['num_shards']
+        if (not isinstance(num_shards, int) or isinstance(num_shards, bool)
+                or not 0 <= num_shards <= MAX_SHARDS):
+            return jsonify({
+                "success": False,
+                "error": f"num_shards must be an integer from 0 to {MAX_SHARDS}"
+            }), 400
+        config['num_shards'] = num_shards
+
+    # A plan only fits the model and epsilon it was compiled for, so an
+    # inherited plan_dir is dropped when either changes
+    model_keys = ('clusters_file', 'embeddings_file', 'epsilon')
+    if 'plan_dir' not in data and any(config.get(key) != inherited.get(key) for key in model_keys):
+        config['plan_dir'] = None
+
+    version = data.get('version')
+    if version is not None and not (isinstance(version, str) and re.fullmatch(r'[\w.-]{1,64}', version)):
+        return jsonify({
+            "success": False,
+            "error": "version must be a short name of letters, digits, '.', '_' or '-'"
+        }), 400
+
+    version = registry.load_async(version, **config)
+    if version is None:
+        return jsonify({
+            "success": False,
+            "error": "A model version is already loading"
+        }), 409
+
+    return jsonify({
+        "success": True,
+        "loading_version": version,
+        "active_version": g.model.version if g.model else None
+    }), 202
+
+
 @app.route('/test-replacement', methods=['POST'])
 def test_replacement():
     """Test endpoint for debugging word replacement."""
@@ -198,6 +606,7 @@ def test_replacement():
             })
 
         # Test replacement multiple times to show variation
+        replacer = g.model.replacer
         replacements = []
         for i in range(5):
             result = replacer.replace_word(word)
@@ -231,13 +640,94 @@ def test_replacement():
         }), 500
 
 
+@app.route('/replacement-distribution', methods=['POST'])
+def replacement_distribution():
+    """
+    Exact replacement distribution P(replacement | word, epsilon) for one or
+    more words and epsilons, for tuning epsilon without sampling.
+    """
+    try:
+        data = request.get_json()
+        if not data or not ('words' in data or 'word' in data):
+            return jsonify({
+                "success": False,
+                "error": "No words provided"
+            }), 400
+
+        words = data['words'] if 'words' in data else [data.get('word')]
+        epsilons = data['epsilons'] if 'epsilons' in data else [data.get('epsilon', 20.0)]
+        top_k = data.get('top_k', 10)
+
+        if not isinstance(words, list) or not all(isinstance(word, str) for word in words):
+            return jsonify({
+                "success": False,
+                "error": "words must be a list of strings"
+            }), 400
+
+        if (not isinstance(epsilons, list) or not epsilons
+                or not all(is_number(epsilon) and epsilon > 0 for epsilon in epsilons)):
+            return jsonify({
+                "success": False,
+                "error": "epsilons must be a non-empty list of positive numbers"
+            }), 400
+
+        if not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 0:
+            return jsonify({
+                "success": False,
+                "error": "top_k must be a non-negative integer"
+            }), 400
+
+        words = [word.strip() for word in words if word.strip()]
+        if not words:
+            return jsonify({
+                "success": False,
+                "error": "Empty word provided"
+            })
+
+        replacer = g.model.replacer
+        if not replacer.supports_distributions:
+            return jsonify({
+                "success": False,
+                "error": "Exact distributions are not available in sharded mode"
+            }), 501
+
+        results = replacer.replacement_distribution(words, epsilons, top_k=top_k)
+
+        return jsonify({
+            "success": True,
+            "epsilons": [float(epsilon) for epsilon in epsilons],
+            "results": results
+        })
+
+    except Exception as e:
+        print(f"Error in replacement-distribution endpoint: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"Distribution failed: {str(e)}"
+        }), 500
+
+
 if __name__ == '__main__':
-    print("Starting Deprivacy Flask server...")
+    show_help = len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help')
+
+    if show_help:
+        print("Usage: python app.py  (starts the Deprivacy Flask server on port 5000)")
+    else:
+        print("Starting Deprivacy Flask server...")
     print("Endpoints available:")
     print("  POST /deprivatize - Main deprivatization endpoint")
     print("  POST /detect-pii - Legacy PII detection endpoint")
     print("  GET /health - Health check")
     print("  POST /test-replacement - Test word replacement")
-    
+    print("  POST /replacement-distribution - Exact replacement distribution")
+    print("  POST /admin/reload - Load a new embeddings/clusters version")
+
+    if show_help:
+        sys.exit(0)
+
+    # With the debug reloader, only the serving child process loads models
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_loading()
+
     # Run Flask development server
     app.run(port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,81 @@
+import sys
+import json
+import subprocess
+
+# Run from the backend directory: python benchmark_import_time.py
+
+# Modules that must stay cheap to import, with their time budget in milliseconds
+# (measured on top of a bare interpreter start, best of several runs)
+IMPORT_BUDGETS_MS = {
+    "deprivacy_replacer": 300,
+    "replacement_plan": 300,
+    "sharded_replacer": 300,
+    "find_closest_words": 300,
+    "preprocess_embeddings": 300,
+    "gazetteer_detector": 50,
+    "analysis_cache": 50,
+    "model_registry": 50,
+    "app": 1000,
+}
+
+# Heavy dependencies that must only be imported on first use
+LAZY_MODULES = ["scipy", "rapidfuzz", "presidio_analyzer", "spacy"]
+
+MEASURE_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({"ms": elapsed, "loaded": [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def measure_import(module, runs=3):
+    """
+    Import module in fresh interpreters and return the best time in
+    milliseconds along with the lazy modules it pulled in.
+    """
+    best = None
+    loaded = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", MEASURE_SCRIPT, module] + LAZY_MODULES,
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result["ms"] < best:
+            best = result["ms"]
+        loaded = result["loaded"]
+    return best, loaded
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print("Usage: python benchmark_import_time.py [module ...]")
+        print("Fails if a module exceeds its import budget or eagerly imports "
+              + ", ".join(LAZY_MODULES))
+        sys.exit(0)
+
+    modules = sys.argv[1:] or list(IMPORT_BUDGETS_MS)
+    failures = 0
+
+    for module in modules:
+        budget = IMPORT_BUDGETS_MS.get(module)
+        try:
+            elapsed, loaded = measure_import(module)
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<25} FAILED to import: {e.stderr.strip().splitlines()[-1]}")
+            failures += 1
+            continue
+
+        problems = []
+        if budget is not None and elapsed > budget:
+            problems.append(f"over budget of {budget} ms")
+        if loaded:
+            problems.append(f"eagerly imports {', '.join(loaded)}")
+
+        status = "FAIL" if problems else "ok"
+        print(f"{module:<25} {elapsed:8.1f} ms  {status}  {'; '.join(problems)}")
+        failures += bool(problems)
+
+    sys.exit(1 if failures else 0)
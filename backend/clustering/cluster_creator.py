@@ -4,6 +4,7 @@ import numpy as np
 from random import choice
 from tqdm import tqdm
 from scipy.spatial.distance import cdist
+from vocabulary import vocabulary_fingerprint
 
 
 def create_clusters(embeddings, num_clusters=1, metric="euclidean", output_file=None):
@@ -14,7 +15,8 @@ def create_clusters(embeddings, num_clusters=1, metric="euclidean", output_file=
         embeddings: Dictionary mapping words to their embedding vectors
         num_clusters: Number of clusters to create
         metric: Distance metric for clustering (default: euclidean)
-        output_file: Optional path to save clusters as JSON
+        output_file: Optional path to save clusters (.json, or .npz for the
+            binary row-index format)
     
     Returns:
         Dictionary mapping cluster indices to lists of words
@@ -60,7 +62,54 @@ def create_clusters(embeddings, num_clusters=1, metric="euclidean", output_file=
     # Save clusters if output file is specified
     if output_file:
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, "w") as f:
-            json.dump(clusters, f, indent=2)
+        if output_file.endswith(".npz"):
+            save_clusters_binary(clusters, list(embeddings.keys()), output_file)
+        else:
+            with open(output_file, "w") as f:
+                json.dump(clusters, f, indent=2)
 
-    return clusters
\ No newline at end of file
+    return clusters
+
+
+def save_clusters_binary(clusters, vocabulary, output_file):
+    """
+    Save clusters in the compact binary format.
+
+    Each word is stored as its int32 row index in the embeddings file, and
+    cluster boundaries are kept in an offsets array (CSR-style): the words of
+    the n-th cluster in `labels` are `indices[offsets[n]:offsets[n + 1]]`.
+    Words that are not in the vocabulary have no row and are dropped, so
+    unlike with the JSON format they are not found (and not replaced) later.
+
+    Args:
+        clusters: Dictionary mapping cluster indices to lists of words
+        vocabulary: Words in embedding row order (the order of the .vec file)
+        output_file: Path to the .npz file to write
+
+    Returns:
+        Number of words that were skipped because they are not in the vocabulary
+    """
+    row_of = {word: row for row, word in enumerate(vocabulary)}
+    labels = sorted(int(label) for label in clusters.keys())
+    indices = []
+    offsets = [0]
+    skipped = 0
+
+    for label in labels:
+        words = clusters[label] if label in clusters else clusters[str(label)]
+        for word in words:
+            if word in row_of:
+                indices.append(row_of[word])
+            else:
+                skipped += 1
+        offsets.append(len(indices))
+
+    np.savez(
+        output_file,
+        labels=np.array(labels, dtype=np.int32),
+        offsets=np.array(offsets, dtype=np.int64),
+        indices=np.array(indices, dtype=np.int32),
+        vocab_size=np.int64(len(vocabulary)),
+        vocab_fingerprint=np.array(vocabulary_fingerprint(vocabulary)),
+    )
+    return skipped
\ No newline at end of file
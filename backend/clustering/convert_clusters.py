@@ -0,0 +1,55 @@
+import sys
+import json
+import os
+from cluster_creator import save_clusters_binary
+from vocabulary import read_vocabulary
+
+
+if __name__ == "__main__":
+    allow_missing = "--allow-missing" in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg != "--allow-missing"]
+
+    if len(args) != 3 or args[0] in ("-h", "--help"):
+        print("Usage: python convert_clusters.py [--allow-missing] <clusters_json> <embeddings_vec> <output_npz>")
+        print("Example: python convert_clusters.py clusters/embeddings_clusters.json "
+              "../embeddings/pii_entities_crawl-300d-2M.vec clusters/embeddings_clusters.npz")
+        print("Note: The binary format stores embedding rows, so clustered words without an embedding")
+        print("      cannot be kept. With the JSON clusters such a word still gets a uniform replacement")
+        print("      from its cluster; with the binary clusters it is no longer found and is not replaced.")
+        print("      Conversion fails if there are such words unless --allow-missing is given.")
+        sys.exit(0 if args and args[0] in ("-h", "--help") else 1)
+
+    clusters_file, vec_file, output_file = args
+
+    for path in (clusters_file, vec_file):
+        if not os.path.exists(path):
+            print(f"Error: Input file '{path}' not found.")
+            sys.exit(1)
+
+    print(f"Loading clusters from {clusters_file}...")
+    with open(clusters_file, "r") as f:
+        clusters = {int(k): v for k, v in json.load(f).items()}
+
+    print(f"Loading vocabulary from {vec_file}...")
+    vocabulary = read_vocabulary(vec_file)
+    print(f"Vocabulary size: {len(vocabulary)}")
+
+    vocabulary_words = set(vocabulary)
+    missing = [word for words in clusters.values() for word in words if word not in vocabulary_words]
+    if missing and not allow_missing:
+        print(f"Error: {len(missing)} clustered words have no embedding (e.g. {', '.join(missing[:5])}).")
+        print("They would no longer be replaced with the binary clusters; "
+              "pass --allow-missing to drop them anyway.")
+        sys.exit(1)
+
+    output_dir = os.path.dirname(output_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    skipped = save_clusters_binary(clusters, vocabulary, output_file)
+    if skipped:
+        print(f"Warning: {skipped} clustered words were not found in the embeddings and were dropped; "
+              f"they will not be replaced")
+
+    print(f"Converted {len(clusters)} clusters to {output_file} "
+          f"({os.path.getsize(clusters_file)} -> {os.path.getsize(output_file)} bytes)")
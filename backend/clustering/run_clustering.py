@@ -1,5 +1,6 @@
 import numpy as np
 from cluster_creator import create_clusters
+from vocabulary import iter_vec_file
 
 
 def load_embeddings(vec_file):
@@ -16,21 +17,12 @@ def load_embeddings(vec_file):
     
     print(f"Loading embeddings from {vec_file}...")
     
-    with open(vec_file, 'r', encoding='utf-8') as f:
-        # Read the first line to get vocab size and dimensions
-        first_line = f.readline().strip()
-        vocab_size, dimensions = map(int, first_line.split())
-        print(f"Vocabulary size: {vocab_size}, Dimensions: {dimensions}")
-        
-        # Read embeddings
-        for line_num, line in enumerate(f, 1):
-            if line_num % 50000 == 0:
-                print(f"Loaded {line_num} embeddings...")
-                
-            parts = line.strip().split()
-            word = parts[0]
-            vector = np.array([float(x) for x in parts[1:]])
-            embeddings[word] = vector
+    # Rows are read as in the replacer, so binary clusters map to the same words
+    for line_num, (word, vector_text) in enumerate(iter_vec_file(vec_file), 1):
+        if line_num % 50000 == 0:
+            print(f"Loaded {line_num} embeddings...")
+
+        embeddings[word] = np.array([float(x) for x in vector_text.split()])
     
     print(f"Loaded {len(embeddings)} embeddings")
     return embeddings
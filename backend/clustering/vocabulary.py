@@ -0,0 +1,51 @@
+import hashlib
+
+
+def iter_vec_file(vec_file):
+    """
+    Yield (word, vector_text) for every embedding row of a .vec file, in row order.
+
+    This is the single definition of how rows are numbered, shared by the
+    replacer, the clustering scripts and the binary cluster format: a
+    "<count> <dimensions>" header line is skipped, lines without a vector
+    are skipped and a repeated word keeps its first row.
+
+    Args:
+        vec_file: Path to the .vec file
+
+    Yields:
+        (word, vector_text) where vector_text is the rest of the line
+    """
+    seen = set()
+
+    with open(vec_file, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f):
+            if line_number == 0 and len(line.split()) == 2:
+                continue
+
+            parts = line.split(None, 1)
+            if len(parts) == 2 and parts[0] not in seen:
+                seen.add(parts[0])
+                yield parts[0], parts[1]
+
+
+def read_vocabulary(vec_file):
+    """
+    Read only the words of a .vec file, in embedding row order.
+
+    Returns:
+        List of words; position in the list is the embedding row index
+    """
+    return [word for word, _ in iter_vec_file(vec_file)]
+
+
+def vocabulary_fingerprint(vocabulary):
+    """
+    SHA-256 of the vocabulary in row order. Stored with binary clusters so
+    they are only ever resolved against the embeddings they were built from.
+    """
+    digest = hashlib.sha256()
+    for word in vocabulary:
+        digest.update(word.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
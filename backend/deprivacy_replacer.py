@@ -1,11 +1,22 @@
 import os
 import json
+import hashlib
+import threading
 import numpy as np
-from scipy.spatial.distance import cdist, pdist
-from rapidfuzz import fuzz
+from replacement_plan import ReplacementPlan
+from clustering.vocabulary import iter_vec_file, read_vocabulary, vocabulary_fingerprint
+
+# scipy and rapidfuzz are imported where they are used, so importing this
+# module (e.g. for --help or a health check) stays fast
 
 
 class DeprivacyReplacer:
+    # Whether stage_probabilities/replacement_distribution are available
+    supports_distributions = True
+
+    # False once the replacer can no longer serve every request (see ShardedReplacer)
+    healthy = True
+
     def __init__(
         self,
         clusters_file="clustering/clusters/embeddings_clusters.json",
@@ -14,6 +25,8 @@ class DeprivacyReplacer:
         distance_metric="euclidean",
         dp_type="metric",
         K=1,
+        plan_dir=None,
+        cluster_range=None,
     ):
         self.clusters_file = clusters_file
         self.embeddings_file = embeddings_file
@@ -21,17 +34,49 @@ class DeprivacyReplacer:
         self.distance_metric = distance_metric
         self.dp_type = dp_type
         self.K = K
+        self.plan_dir = plan_dir
+        self.cluster_range = cluster_range
         
         # Load embeddings and clusters
-        self.embeddings = self.load_embeddings()
-        self.clusters = self.load_clusters()
+        self.load_model()
         
-        # Calculate distances and sensitivities
-        self.inter_distances, self.inter_cluster_sensitivity = self.calculate_inter_cluster_distances()
-        self.intra_cluster_sensitivity = self.calculate_intra_cluster_distances()
+        # Distances and sensitivities are calculated on first use (see warm_up)
+        self._inter_cluster_tables = None
+        self._intra_cluster_sensitivity = None
+        self._tables_lock = threading.RLock()
+
+        # Flattened cluster arrays for replacement_distribution, built on first use
+        self._distribution_index = None
+
+        # Precompiled alias tables for this epsilon (see replacement_plan.py)
+        self.plan = self.load_plan() if plan_dir else None
+
+    def load_model(self):
+        """Load the clusters and embeddings (only those of cluster_range, if set)"""
+        if self.cluster_range is None:
+            self.embeddings = self.load_embeddings()
+            self.clusters = self.load_clusters()
+            return
+
+        # Shard: keep only clusters with start <= label < end and their embeddings
+        start, end = self.cluster_range
+        vocabulary = self.load_vocabulary() if self.clusters_file.endswith(".npz") else None
+        self.clusters = {
+            label: words for label, words in self.load_clusters(vocabulary).items()
+            if start <= label < end
+        }
+        self.embeddings = self.load_embeddings(
+            keep_words={word for words in self.clusters.values() for word in words}
+        )
+
+    def load_vocabulary(self):
+        """Read only the words of the embeddings file, in the row order load_embeddings uses"""
+        if not os.path.exists(self.embeddings_file):
+            return []
+        return read_vocabulary(self.embeddings_file)
 
-    def load_embeddings(self):
-        """Load embeddings from the PII entities file"""
+    def load_embeddings(self, keep_words=None):
+        """Load embeddings from the PII entities file (only keep_words, if given)"""
         embeddings = {}
         
         if not os.path.exists(self.embeddings_file):
@@ -39,33 +84,73 @@ class DeprivacyReplacer:
             return embeddings
             
         print("Loading embeddings...")
-        with open(self.embeddings_file, 'r', encoding='utf-8') as f:
-            first_line = next(f).strip().split()
-            if len(first_line) == 2:
-                # Skip header line if it contains vocab size and dimensions
-                pass
-            else:
-                # First line is actually a word embedding
-                word = first_line[0]
-                vector = np.array([float(x) for x in first_line[1:]])
-                embeddings[word] = vector
-            
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) > 1:
-                    word = parts[0]
-                    vector = np.array([float(x) for x in parts[1:]])
-                    embeddings[word] = vector
+        for word, vector_text in iter_vec_file(self.embeddings_file):
+            if keep_words is None or word in keep_words:
+                embeddings[word] = np.array([float(x) for x in vector_text.split()])
         
         print(f"Loaded {len(embeddings)} word embeddings")
         return embeddings
 
-    def load_clusters(self):
-        """Load clusters from JSON file"""
+    def load_plan(self):
+        """Load a compiled replacement plan, refusing one compiled for another model or epsilon"""
+        if not os.path.exists(os.path.join(self.plan_dir, "meta.json")):
+            print(f"Warning: Replacement plan {self.plan_dir} not found")
+            return None
+
+        plan = ReplacementPlan(self.plan_dir)
+        meta = plan.meta
+        expected = {
+            "epsilon": self.epsilon,
+            "clusters_file": os.path.realpath(self.clusters_file),
+            "embeddings_file": os.path.realpath(self.embeddings_file),
+            "distance_metric": self.distance_metric,
+            "dp_type": self.dp_type,
+            "K": self.K,
+            "model_fingerprint": self.model_fingerprint(),
+        }
+        for key, value in expected.items():
+            compiled = meta.get(key)
+            if key.endswith("_file") and compiled is not None:
+                compiled = os.path.realpath(compiled)
+            if compiled != value:
+                raise ValueError(
+                    f"Replacement plan {self.plan_dir} was compiled for {key}={compiled!r}, "
+                    f"not {value!r}; recompile it with replacement_plan.py"
+                )
+
+        dropped = (meta.get("max_stage1_dropped_mass", 0.0), meta.get("max_stage2_dropped_mass", 0.0))
+        if any(dropped):
+            print(f"Warning: Replacement plan {self.plan_dir} is truncated (max dropped mass "
+                  f"{dropped[0]:.2e} in stage 1, {dropped[1]:.2e} in stage 2); its replacements "
+                  f"do not keep the exact epsilon-DP guarantee")
+
+        print(f"Loaded replacement plan for {len(plan.words)} words")
+        return plan
+
+    def model_fingerprint(self):
+        """
+        SHA-256 of the cluster labels and their embedded words, in cluster
+        order; identifies the model a replacement plan was compiled for
+        """
+        digest = hashlib.sha256()
+        for label, words in self.clusters.items():
+            digest.update(f"{label}:".encode("utf-8"))
+            for word in words:
+                if word in self.embeddings:
+                    digest.update(word.encode("utf-8"))
+                    digest.update(b"\n")
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def load_clusters(self, vocabulary=None):
+        """Load clusters from JSON file or from the binary .npz format"""
         if not os.path.exists(self.clusters_file):
             print(f"Warning: Clusters file {self.clusters_file} not found")
             return {}
-            
+
+        if self.clusters_file.endswith(".npz"):
+            return self.load_clusters_binary(vocabulary)
+
         with open(self.clusters_file, "r") as f:
             data = json.load(f)
         
@@ -74,6 +159,77 @@ class DeprivacyReplacer:
         print(f"Loaded {len(clusters)} clusters")
         return clusters
 
+    def load_clusters_binary(self, vocabulary=None):
+        """
+        Load clusters stored as embedding row indices plus offsets
+        (see clustering/cluster_creator.py save_clusters_binary).
+        Words are looked up by row position instead of parsing cluster JSON;
+        the vocabulary is hashed once to check it matches the stored
+        fingerprint, which costs one SHA-256 pass over all words.
+        """
+        with np.load(self.clusters_file) as data:
+            labels = data["labels"].tolist()
+            offsets = data["offsets"].tolist()
+            indices = data["indices"].tolist()
+            vocab_size = int(data["vocab_size"])
+            fingerprint = str(data["vocab_fingerprint"]) if "vocab_fingerprint" in data else None
+
+        if vocabulary is None:
+            vocabulary = list(self.embeddings.keys())
+        # Row indices are only meaningful for the exact vocabulary they were built from
+        if vocab_size != len(vocabulary):
+            raise ValueError(
+                f"Clusters file {self.clusters_file} was built for {vocab_size} embeddings, "
+                f"but {self.embeddings_file} has {len(vocabulary)}"
+            )
+        if fingerprint is None:
+            print(f"Warning: Clusters file {self.clusters_file} has no vocabulary fingerprint; "
+                  f"reconvert it with clustering/convert_clusters.py")
+        elif fingerprint != vocabulary_fingerprint(vocabulary):
+            raise ValueError(
+                f"Clusters file {self.clusters_file} was built for a different vocabulary "
+                f"than {self.embeddings_file}"
+            )
+
+        clusters = {
+            label: [vocabulary[row] for row in indices[offsets[n]:offsets[n + 1]]]
+            for n, label in enumerate(labels)
+        }
+        print(f"Loaded {len(clusters)} clusters")
+        return clusters
+
+    @property
+    def num_embeddings(self):
+        return len(self.embeddings)
+
+    @property
+    def inter_distances(self):
+        return self._get_inter_cluster_tables()[0]
+
+    @property
+    def inter_cluster_sensitivity(self):
+        return self._get_inter_cluster_tables()[1]
+
+    @property
+    def intra_cluster_sensitivity(self):
+        if self._intra_cluster_sensitivity is None:
+            with self._tables_lock:
+                if self._intra_cluster_sensitivity is None:
+                    self._intra_cluster_sensitivity = self.calculate_intra_cluster_distances()
+        return self._intra_cluster_sensitivity
+
+    def _get_inter_cluster_tables(self):
+        if self._inter_cluster_tables is None:
+            with self._tables_lock:
+                if self._inter_cluster_tables is None:
+                    self._inter_cluster_tables = self.calculate_inter_cluster_distances()
+        return self._inter_cluster_tables
+
+    def warm_up(self):
+        """Calculate all distance tables now instead of on the first replacement"""
+        self._get_inter_cluster_tables()
+        self.intra_cluster_sensitivity
+
     def find_word_cluster(self, word):
         """Find which cluster a word belongs to"""
         word_lower = word.lower()
@@ -92,11 +248,8 @@ class DeprivacyReplacer:
         probabilities /= np.sum(probabilities)
         return probabilities
 
-    def calculate_inter_cluster_distances(self):
-        """Calculate distances between cluster centroids"""
-        if not self.clusters or not self.embeddings:
-            return np.array([]), 1.0
-            
+    def calculate_centroids(self):
+        """Calculate the (K-scaled) centroid of each cluster, keyed by cluster label"""
         centroids = {}
         
         # Calculate centroids of each cluster
@@ -114,6 +267,16 @@ class DeprivacyReplacer:
                     embedding_dim = next(iter(self.embeddings.values())).shape[0]
                     centroids[label] = np.zeros(embedding_dim)
 
+        return centroids
+
+    def calculate_inter_cluster_distances(self):
+        """Calculate distances between cluster centroids"""
+        from scipy.spatial.distance import cdist
+
+        if not self.clusters or not self.embeddings:
+            return np.array([]), 1.0
+
+        centroids = self.calculate_centroids()
         if not centroids:
             return np.array([]), 1.0
 
@@ -133,6 +296,8 @@ class DeprivacyReplacer:
 
     def calculate_intra_cluster_distances(self):
         """Calculate maximum intra-cluster distances for each cluster"""
+        from scipy.spatial.distance import pdist
+
         intra_cluster_sensitivity = {}
         
         for label, words in self.clusters.items():
@@ -153,6 +318,8 @@ class DeprivacyReplacer:
 
     def is_clean_suggestion(self, candidate, query, similarity_threshold=90):
         """Check if candidate word is clean (not a typo/variation of query)"""
+        from rapidfuzz import fuzz
+
         similarity = fuzz.partial_ratio(candidate, query)
         return similarity < similarity_threshold
 
@@ -166,44 +333,74 @@ class DeprivacyReplacer:
         Returns:
             tuple: (replacement_word, target_cluster_id, selected_cluster_id) or (None, None, None) if word not found
         """
+        if self.plan is not None:
+            # Two alias draws; words outside the plan use the full mechanism below
+            result = self.plan.replace_word(target_word)
+            if result is not None:
+                return result
+
         target_word_lower = target_word.lower()
         target_cluster_label = self.find_word_cluster(target_word_lower)
 
         if target_cluster_label is None:
             return None, None, None
 
+        # Stage 1: Select cluster using exponential mechanism
+        selected_cluster_label = self.select_cluster(target_cluster_label)
+
+        # Stage 2: Select word from chosen cluster
+        selected_word = self.select_word(
+            target_word_lower, self.get_embedding(target_word_lower), selected_cluster_label
+        )
+        return selected_word, target_cluster_label, selected_cluster_label
+
+    def get_embedding(self, word):
+        """Embedding vector of a word, or None"""
+        return self.embeddings.get(word)
+
+    def select_cluster(self, target_cluster_label):
+        """Stage 1: select a cluster for a word in target_cluster_label"""
         # If only one cluster or simple mechanism, use the target cluster
         if len(self.clusters) == 1:
-            selected_cluster_label = target_cluster_label
-        else:
-            # Stage 1: Select cluster using exponential mechanism
-            distances_from_cluster = [
-                -self.inter_distances[target_cluster_label][i]
-                for i in range(len(self.clusters))
-            ]
-            probabilities = self.exponential_mechanism(
-                distances_from_cluster, self.inter_cluster_sensitivity
-            )
-            selected_cluster_label = np.random.choice(
-                list(self.clusters.keys()), p=probabilities
-            )
+            return target_cluster_label
+
+        distances_from_cluster = [
+            -self.inter_distances[target_cluster_label][i]
+            for i in range(len(self.clusters))
+        ]
+        probabilities = self.exponential_mechanism(
+            distances_from_cluster, self.inter_cluster_sensitivity
+        )
+        return np.random.choice(list(self.clusters.keys()), p=probabilities)
+
+    def select_word(self, target_word_lower, target_word_embedding, selected_cluster_label):
+        """
+        Stage 2: select a replacement from the selected cluster
+
+        Args:
+            target_word_lower (str): The lowercased word to replace
+            target_word_embedding (np.ndarray): Its embedding, or None if it has none
+            selected_cluster_label (int): Cluster chosen in stage 1
+
+        Returns:
+            str: The replacement word, or None if the cluster has no embedded words
+        """
+        from scipy.spatial.distance import cdist
 
-        # Stage 2: Select word from chosen cluster
         selected_cluster_words = self.clusters[selected_cluster_label]
         
         # Filter to only words that exist in embeddings
         valid_words = [word for word in selected_cluster_words if word in self.embeddings]
         
         if not valid_words:
-            return None, target_cluster_label, selected_cluster_label
+            return None
 
         # If target word has no embedding, return random word from cluster
-        if target_word_lower not in self.embeddings:
-            selected_word = np.random.choice(valid_words)
-            return selected_word, target_cluster_label, selected_cluster_label
+        if target_word_embedding is None:
+            return np.random.choice(valid_words)
 
         # Calculate distances from target word to all valid words in selected cluster
-        target_word_embedding = np.array(self.embeddings[target_word_lower]).reshape(1, -1)
+        target_word_embedding = np.array(target_word_embedding).reshape(1, -1)
         word_embeddings = np.array([self.embeddings[word] for word in valid_words])
 
         distances_from_word = cdist(
@@ -224,28 +421,287 @@ class DeprivacyReplacer:
         
         # Additional filtering for clean suggestions
         if self.is_clean_suggestion(selected_word, target_word_lower):
-            return selected_word, target_cluster_label, selected_cluster_label
+            return selected_word
+
+        # If selected word is too similar, try another approach
+        clean_words = [word for word in valid_words 
+                      if self.is_clean_suggestion(word, target_word_lower)]
+        if not clean_words:
+            return selected_word
+
+        # Re-calculate probabilities for clean words only
+        clean_embeddings = np.array([self.embeddings[word] for word in clean_words])
+        clean_distances = cdist(
+            target_word_embedding,
+            clean_embeddings,
+            metric=self.distance_metric,
+        ).flatten()
+        
+        clean_probabilities = self.exponential_mechanism(
+            -clean_distances,
+            cluster_sensitivity,
+        )
+        return np.random.choice(clean_words, p=clean_probabilities)
+
+    def distribution_index(self):
+        """
+        The embedded words of all clusters flattened into arrays, in cluster
+        order: words[offsets[c]:offsets[c + 1]] are the words of labels[c].
+        Built on first use.
+        """
+        if self._distribution_index is None:
+            with self._tables_lock:
+                if self._distribution_index is None:
+                    self._distribution_index = self._build_distribution_index()
+        return self._distribution_index
+
+    def _build_distribution_index(self):
+        labels = list(self.clusters.keys())
+        words = []
+        offsets = [0]
+        for label in labels:
+            words.extend(word for word in self.clusters[label] if word in self.embeddings)
+            offsets.append(len(words))
+
+        offsets = np.array(offsets)
+        cluster_positions = np.repeat(np.arange(len(labels)), np.diff(offsets))
+        if words:
+            matrix = np.array([self.embeddings[word] for word in words])
         else:
-            # If selected word is too similar, try another approach
-            clean_words = [word for word in valid_words 
-                          if self.is_clean_suggestion(word, target_word_lower)]
-            if clean_words:
-                # Re-calculate probabilities for clean words only
-                clean_embeddings = np.array([self.embeddings[word] for word in clean_words])
-                clean_distances = cdist(
-                    target_word_embedding,
-                    clean_embeddings,
-                    metric=self.distance_metric,
-                ).flatten()
-                
-                clean_probabilities = self.exponential_mechanism(
-                    -clean_distances,
-                    cluster_sensitivity,
-                )
-                final_word = np.random.choice(clean_words, p=clean_probabilities)
-                return final_word, target_cluster_label, selected_cluster_label
-            else:
-                return selected_word, target_cluster_label, selected_cluster_label
+            matrix = np.zeros((0, 0))
+        sensitivities = np.array(
+            [self.intra_cluster_sensitivity.get(label, 1.0) for label in labels], dtype=float
+        )
+
+        return {
+            "labels": labels,
+            "label_positions": {label: position for position, label in enumerate(labels)},
+            "words": words,
+            "offsets": offsets,
+            "cluster_positions": cluster_positions,
+            "matrix": matrix,
+            "sensitivities": sensitivities,
+        }
+
+    @staticmethod
+    def _exponential_probabilities(epsilons, utilities, sensitivity):
+        """Exponential mechanism for several epsilons at once (one row per epsilon)"""
+        if sensitivity == 0:
+            return np.full((len(epsilons), utilities.shape[-1]), 1.0 / utilities.shape[-1])
+
+        logits = epsilons[:, None] * utilities[None, :] / (2 * sensitivity)
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        return probabilities
+
+    @staticmethod
+    def _segment_sums(values, offsets):
+        """Sum the columns of values within each [offsets[i], offsets[i + 1]) segment"""
+        cumulative = np.concatenate(
+            [np.zeros((values.shape[0], 1)), np.cumsum(values, axis=1)], axis=1
+        )
+        return cumulative[:, offsets[1:]] - cumulative[:, offsets[:-1]]
+
+    def _segment_softmax(self, logits, offsets, cluster_positions, mask=None):
+        """
+        Softmax of logits within each cluster segment. Columns where mask is
+        False get probability 0; segments with no allowed columns are all 0.
+        """
+        if mask is not None:
+            logits = np.where(mask[None, :], logits, -np.inf)
+
+        starts = offsets[:-1]
+        nonempty = np.flatnonzero(offsets[1:] > starts)
+        segment_max = np.full((logits.shape[0], len(starts)), -np.inf)
+        if len(nonempty):
+            segment_max[:, nonempty] = np.maximum.reduceat(logits, starts[nonempty], axis=1)
+        segment_max = np.where(np.isfinite(segment_max), segment_max, 0.0)
+
+        weights = np.exp(logits - segment_max[:, cluster_positions])
+        totals = self._segment_sums(weights, offsets)
+        totals = np.where(totals > 0, totals, 1.0)
+        return weights / totals[:, cluster_positions]
+
+    def stage_probabilities(self, target_word_lower, target_cluster_label, epsilons,
+                            similarity_threshold=90, cluster_subset=None):
+        """
+        Exact stage-1 and stage-2 probabilities of replace_word for one word.
+
+        Args:
+            target_word_lower (str): The lowercased word to replace
+            target_cluster_label (int): Its cluster, from find_word_cluster
+            epsilons (np.ndarray): Privacy parameters, one output row each
+            similarity_threshold (int): Same threshold as is_clean_suggestion
+            cluster_subset (np.ndarray): Positions (in distribution_index()
+                labels) of the clusters to compute stage 2 for (default: all)
+
+        Returns:
+            tuple: (target_position, stage1, stage2, distances, word_positions)
+            where stage1[e, c] is the probability of selecting the c-th cluster
+            of distribution_index(), stage2[e, j] the probability of the word at
+            word_positions[j] given that its cluster was selected, and distances
+            the embedding distances to those words (None if the word has no
+            embedding)
+        """
+        from scipy.spatial.distance import cdist
+        from rapidfuzz import fuzz, process
+
+        index = self.distribution_index()
+        labels = index["labels"]
+        offsets = index["offsets"]
+
+        # Words of the requested clusters, with segment offsets local to them
+        if cluster_subset is None:
+            word_positions = np.arange(len(index["words"]))
+            segment_offsets = offsets
+            segment_ids = index["cluster_positions"]
+        else:
+            cluster_subset = np.asarray(cluster_subset, dtype=int)
+            sizes = offsets[cluster_subset + 1] - offsets[cluster_subset]
+            word_positions = np.concatenate(
+                [np.arange(offsets[c], offsets[c + 1]) for c in cluster_subset] + [np.zeros(0, dtype=int)]
+            )
+            segment_offsets = np.concatenate([[0], np.cumsum(sizes)])
+            segment_ids = np.repeat(np.arange(len(cluster_subset)), sizes)
+
+        # Stage 1: cluster probabilities, one row per epsilon
+        target_position = index["label_positions"][target_cluster_label]
+        if len(labels) == 1:
+            stage1 = np.ones((len(epsilons), 1))
+        else:
+            stage1 = self._exponential_probabilities(
+                epsilons,
+                -np.asarray(self.inter_distances[target_cluster_label][:len(labels)]),
+                self.inter_cluster_sensitivity,
+            )
+
+        # Stage 2: word probabilities within each cluster
+        if target_word_lower in self.embeddings:
+            target_word_embedding = np.array(self.embeddings[target_word_lower]).reshape(1, -1)
+            distances = cdist(
+                target_word_embedding, index["matrix"][word_positions], metric=self.distance_metric
+            )[0]
+
+            sensitivities = index["sensitivities"][index["cluster_positions"][word_positions]]
+            safe_sensitivities = np.where(sensitivities == 0, 1.0, sensitivities)
+            logits = np.where(
+                sensitivities[None, :] == 0,
+                0.0,
+                -epsilons[:, None] * distances[None, :] / (2 * safe_sensitivities[None, :]),
+            )
+
+            candidates = [index["words"][i] for i in word_positions]
+            clean = process.cdist(
+                candidates, [target_word_lower], scorer=fuzz.partial_ratio
+            )[:, 0] < similarity_threshold
+            probabilities = self._segment_softmax(logits, segment_offsets, segment_ids)
+            clean_probabilities = self._segment_softmax(logits, segment_offsets, segment_ids, mask=clean)
+
+            # A too-similar draw is replaced by a draw over the clean words only
+            unclean_mass = self._segment_sums(probabilities * ~clean[None, :], segment_offsets)
+            has_clean = self._segment_sums(clean[None, :].astype(float), segment_offsets)[0] > 0
+            stage2 = np.where(
+                has_clean[segment_ids][None, :],
+                probabilities * clean[None, :] + unclean_mass[:, segment_ids] * clean_probabilities,
+                probabilities,
+            )
+        else:
+            # Without an embedding the replacement is uniform within the cluster
+            distances = None
+            cluster_sizes = np.maximum(np.diff(segment_offsets), 1)
+            stage2 = np.tile(1.0 / cluster_sizes[segment_ids], (len(epsilons), 1))
+
+        return target_position, stage1, stage2, distances, word_positions
+
+    def replacement_distribution(self, words, epsilons=None, top_k=10, similarity_threshold=90):
+        """
+        Exact distribution of replace_word outputs, instead of sampling it.
+
+        P(replacement | word, epsilon) is the stage-1 cluster probability times
+        the stage-2 in-cluster probability, including the resampling of
+        replacements that are too similar to the word.
+
+        Args:
+            words (list): Words to replace
+            epsilons (list): Privacy parameters to evaluate (default: self.epsilon)
+            top_k (int): Number of most likely replacements to return
+            similarity_threshold (int): Same threshold as is_clean_suggestion
+
+        Returns:
+            list: One dict per word with the target cluster and, per epsilon, the
+            top_k replacements, the expected embedding distance of the
+            replacement, the probability of staying in the target cluster and the
+            probability that no replacement is found
+        """
+        if epsilons is None:
+            epsilons = [self.epsilon]
+        epsilons = np.atleast_1d(np.asarray(epsilons, dtype=float))
+
+        index = self.distribution_index()
+        labels = index["labels"]
+        vocabulary = index["words"]
+        offsets = index["offsets"]
+        cluster_positions = index["cluster_positions"]
+        empty_clusters = np.diff(offsets) == 0
+
+        results = []
+        for word in words:
+            target_word_lower = word.lower()
+            target_cluster_label = self.find_word_cluster(target_word_lower)
+            result = {
+                "word": word,
+                "target_cluster": int(target_cluster_label) if target_cluster_label is not None else None,
+                "distributions": [],
+            }
+            results.append(result)
+
+            if target_cluster_label is None:
+                for epsilon in epsilons:
+                    result["distributions"].append({
+                        "epsilon": float(epsilon),
+                        "replacements": [],
+                        "expected_distance": None,
+                        "same_cluster_probability": None,
+                        "no_replacement_probability": 1.0,
+                    })
+                continue
+
+            target_position, stage1, stage2, distances, _ = self.stage_probabilities(
+                target_word_lower, target_cluster_label, epsilons, similarity_threshold
+            )
+
+            joint = stage1[:, cluster_positions] * stage2
+            no_replacement = stage1[:, empty_clusters].sum(axis=1)
+
+            k = min(top_k, len(vocabulary))
+            for row, epsilon in enumerate(epsilons):
+                top = np.argpartition(-joint[row], k - 1)[:k] if k else np.array([], dtype=int)
+                top = top[np.argsort(-joint[row][top])]
+
+                replacement_mass = 1.0 - no_replacement[row]
+                if distances is not None and replacement_mass > 0:
+                    expected_distance = float(joint[row] @ distances / replacement_mass)
+                else:
+                    expected_distance = None
+
+                result["distributions"].append({
+                    "epsilon": float(epsilon),
+                    "replacements": [
+                        {
+                            "replacement": vocabulary[i],
+                            "probability": float(joint[row, i]),
+                            "cluster": int(labels[cluster_positions[i]]),
+                        }
+                        for i in top
+                        if joint[row, i] > 0
+                    ],
+                    "expected_distance": expected_distance,
+                    "same_cluster_probability": float(stage1[row, target_position]),
+                    "no_replacement_probability": float(no_replacement[row]),
+                })
+
+        return results
 
 
 # Example usage and testing
@@ -256,6 +712,10 @@ if __name__ == "__main__":
     epsilon = 1.0
     target_word = None
     
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print("Usage: python deprivacy_replacer.py <word> [epsilon]")
+        sys.exit(0)
+
     if len(sys.argv) > 1:
         if len(sys.argv) == 2:
             target_word = sys.argv[1]
@@ -277,15 +737,18 @@ if __name__ == "__main__":
     if target_word:
         print(f"Finding replacement for: {target_word}")
         
-        # Generate multiple replacements to show variation
-        print("\nReplacements:")
-        for i in range(5):
-            replacement, target_cluster, selected_cluster = replacer.replace_word(target_word)
-            if replacement:
-                cluster_info = "same cluster" if target_cluster == selected_cluster else "different cluster"
-                print(f"{i+1}. {replacement} (from {cluster_info}: target={target_cluster}, selected={selected_cluster})")
-            else:
-                print(f"{i+1}. No replacement found")
+        # Show the exact replacement distribution
+        distribution = replacer.replacement_distribution([target_word], [epsilon], top_k=10)[0]
+        if distribution["target_cluster"] is None:
+            print("No replacement found")
+        else:
+            stats = distribution["distributions"][0]
+            print(f"\nMost likely replacements (target cluster={distribution['target_cluster']}, "
+                  f"P(same cluster)={stats['same_cluster_probability']:.4f}):")
+            for i, entry in enumerate(stats["replacements"], 1):
+                print(f"{i:2d}. {entry['replacement']:<15} p={entry['probability']:.4f} (cluster={entry['cluster']})")
+            if stats["expected_distance"] is not None:
+                print(f"Expected distance: {stats['expected_distance']:.4f}")
     else:
         # Test with some example words
         test_words = ["john", "smith", "america", "christian", "paris", "london"]
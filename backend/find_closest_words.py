@@ -1,7 +1,5 @@
 import sys
 import numpy as np
-from scipy.spatial.distance import cdist
-from rapidfuzz import fuzz
 
 
 def load_embeddings(vec_file_path):
@@ -28,10 +26,14 @@ def is_clean_suggestion(candidate, query, similarity_threshold=90):
     returning variations like "bangaldesh", "bangladeshbangladesh", "bangladeshis"
     when querying for "bangladesh".
     """
+    from rapidfuzz import fuzz
+
     similarity = fuzz.partial_ratio(candidate, query)
     return similarity < similarity_threshold
 
 def find_closest_words(target_word, embeddings, k=20):
+    from scipy.spatial.distance import cdist
+
     if target_word not in embeddings:
         return f"Word '{target_word}' not found in embeddings"
     
@@ -63,9 +65,9 @@ def find_closest_words(target_word, embeddings, k=20):
     return clean_suggestions
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
+    if len(sys.argv) != 2 or sys.argv[1] in ("-h", "--help"):
         print("Usage: python find_closest_words.py <word>")
-        sys.exit(1)
+        sys.exit(0 if len(sys.argv) == 2 else 1)
     
     target_word = sys.argv[1].lower()
     vec_file_path = "embeddings/cleaned_crawl-300d-2M.vec"
@@ -0,0 +1,155 @@
+class GazetteerMatch:
+    """A detected entity, with the same fields the app reads from Presidio results"""
+
+    __slots__ = ("entity_type", "start", "end", "score")
+
+    def __init__(self, entity_type, start, end, score=1.0):
+        self.entity_type = entity_type
+        self.start = start
+        self.end = end
+        self.score = score
+
+    def __repr__(self):
+        return f"GazetteerMatch({self.entity_type}, {self.start}, {self.end}, {self.score})"
+
+
+class GazetteerDetector:
+    """
+    Fast-path entity detector built from the replaceable vocabulary.
+
+    All words are compiled into an Aho-Corasick automaton, so a text is
+    scanned once regardless of vocabulary size. Matches must start and end
+    on word boundaries, and overlapping matches are resolved leftmost-longest.
+    """
+
+    ENTITY_TYPE = "VOCABULARY"
+
+    def __init__(self, words, entity_type=ENTITY_TYPE):
+        self.entity_type = entity_type
+
+        # Trie nodes: goto transitions, failure link, length of the word
+        # ending at the node (0 if none) and link to the next node on the
+        # failure chain that ends a word
+        self._goto = [{}]
+        self._fail = [0]
+        self._word_length = [0]
+        self._output_link = [0]
+
+        self.num_words = 0
+        for word in words:
+            if word:
+                self._add_word(word.lower())
+        self._build_failure_links()
+
+    def _add_word(self, word):
+        node = 0
+        for char in word:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._word_length.append(0)
+                self._output_link.append(0)
+            node = next_node
+
+        if not self._word_length[node]:
+            self.num_words += 1
+        self._word_length[node] = len(word)
+
+    def _build_failure_links(self):
+        """Breadth-first pass computing failure and output links"""
+        queue = list(self._goto[0].values())
+        head = 0
+
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                fail = self._goto[fallback].get(char, 0)
+                if fail == child:
+                    fail = 0
+
+                self._fail[child] = fail
+                self._output_link[child] = fail if self._word_length[fail] else self._output_link[fail]
+
+    @staticmethod
+    def _is_word_char(char):
+        return char.isalnum()
+
+    def _lower(self, text):
+        """Lowercase without changing string length, so offsets stay valid"""
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            return lowered
+        return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+    def find_all(self, text):
+        """Return every boundary-delimited vocabulary match as (start, end) pairs"""
+        goto = self._goto
+        fail = self._fail
+        word_length = self._word_length
+        output_link = self._output_link
+        is_word_char = self._is_word_char
+
+        lowered = self._lower(text)
+        text_length = len(text)
+        spans = []
+        node = 0
+
+        for i, char in enumerate(lowered):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            end = i + 1
+            if end < text_length and is_word_char(text[end]):
+                continue
+
+            match_node = node if word_length[node] else output_link[node]
+            while match_node:
+                start = end - word_length[match_node]
+                if start == 0 or not is_word_char(text[start - 1]):
+                    spans.append((start, end))
+                match_node = output_link[match_node]
+
+        return spans
+
+    def analyze(self, text):
+        """
+        Detect vocabulary entities in text.
+
+        Returns:
+            list: Non-overlapping GazetteerMatch objects ordered by start offset
+        """
+        spans = sorted(self.find_all(text), key=lambda span: (span[0], -span[1]))
+
+        matches = []
+        last_end = 0
+        for start, end in spans:
+            if start >= last_end:
+                matches.append(GazetteerMatch(self.entity_type, start, end))
+                last_end = end
+        return matches
+
+
+def merge_results(primary, secondary):
+    """
+    Add results from a second detection pass that do not overlap the first pass.
+
+    Returns:
+        list: Combined results ordered by start offset
+    """
+    merged = list(primary)
+    for result in secondary:
+        if not any(result.start < other.end and other.start < result.end for other in primary):
+            merged.append(result)
+    merged.sort(key=lambda result: result.start)
+    return merged
@@ -0,0 +1,171 @@
+import time
+import threading
+from contextlib import contextmanager
+
+
+class ModelVersion:
+    """A loaded replacer together with its version and in-flight request count"""
+
+    def __init__(self, version, replacer, config):
+        self.version = version
+        self.replacer = replacer
+        self.config = config
+        self.loaded_at = time.time()
+        self.active_requests = 0
+        self.retired = False
+
+        # Per-version derived state, e.g. the gazetteer compiled from its clusters
+        self.extras = {}
+        self.extras_lock = threading.Lock()
+
+    def get_extra(self, name, build):
+        """Return derived state for this version, building it on first use"""
+        with self.extras_lock:
+            if name not in self.extras:
+                self.extras[name] = build(self.replacer)
+            return self.extras[name]
+
+
+class ModelRegistry:
+    """
+    Versioned holder of the active DeprivacyReplacer.
+
+    New versions are built (optionally in a background thread) while the
+    current one keeps serving, then swapped in atomically. Requests hold a
+    reference to the version they started with through acquire(), so a
+    replaced version keeps serving its in-flight requests and is released
+    once its reference count drops to zero.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._active = None
+        # id(ModelVersion) -> retired version still serving requests; version names can repeat
+        self._draining = {}
+        self._loading = None
+        self._version_counter = 0
+        self.last_error = None
+
+    def _next_version(self):
+        self._version_counter += 1
+        return f"v{self._version_counter}"
+
+    def load(self, version=None, **config):
+        """Build a new version with factory(**config) and make it active"""
+        with self._lock:
+            version = version or self._next_version()
+
+        print(f"Building model version {version}...")
+        start_time = time.time()
+        replacer = self.factory(**config)
+        if hasattr(replacer, "warm_up"):
+            try:
+                # Build lazy tables now so the first request on this version stays fast
+                replacer.warm_up()
+            except Exception:
+                # Do not leak the half-built version's resources, such as shard processes
+                self._close(replacer)
+                raise
+        model = ModelVersion(version, replacer, config)
+        print(f"Model version {version} built in {time.time() - start_time:.1f}s")
+
+        self.swap(model)
+        return model
+
+    def load_async(self, version=None, **config):
+        """
+        Build a new version in a background thread and swap it in when ready.
+
+        Returns:
+            str: The version being loaded, or None if another load is in progress
+        """
+        with self._lock:
+            if self._loading is not None:
+                return None
+            version = version or self._next_version()
+            self._loading = version
+
+        def run():
+            try:
+                self.load(version, **config)
+                self.last_error = None
+            except Exception as e:
+                print(f"Error loading model version {version}: {str(e)}")
+                self.last_error = f"{version}: {str(e)}"
+            finally:
+                with self._lock:
+                    self._loading = None
+
+        threading.Thread(target=run, name=f"model-load-{version}", daemon=True).start()
+        return version
+
+    def swap(self, model):
+        """Atomically make model the active version and retire the previous one"""
+        with self._lock:
+            previous = self._active
+            self._active = model
+            drained = False
+            if previous is not None:
+                previous.retired = True
+                if previous.active_requests > 0:
+                    self._draining[id(previous)] = previous
+                else:
+                    drained = True
+        print(f"Model version {model.version} is now active"
+              + (f" (replaced {previous.version})" if previous else ""))
+        if drained:
+            self._close(previous.replacer)
+
+    def retain(self):
+        """Take a reference to the active version, or None if none is loaded yet; pair with release()"""
+        with self._lock:
+            model = self._active
+            if model is not None:
+                model.active_requests += 1
+            return model
+
+    def release(self, model):
+        """Drop a reference taken with retain()"""
+        with self._lock:
+            model.active_requests -= 1
+            drained = (
+                model.retired and model.active_requests == 0
+                and self._draining.pop(id(model), None) is not None
+            )
+        if drained:
+            print(f"Model version {model.version} drained")
+            self._close(model.replacer)
+
+    @staticmethod
+    def _close(replacer):
+        """Release resources held by a replacer, such as shard processes"""
+        close = getattr(replacer, "close", None)
+        if close is not None:
+            close()
+
+    @contextmanager
+    def acquire(self):
+        """Hold a reference to the active version for the duration of a block"""
+        model = self.retain()
+        if model is None:
+            raise RuntimeError("No model version loaded")
+        try:
+            yield model
+        finally:
+            self.release(model)
+
+    def status(self):
+        """Version information for health reporting"""
+        with self._lock:
+            active = self._active
+            return {
+                "active_version": active.version if active else None,
+                "active_loaded_at": active.loaded_at if active else None,
+                "loading_version": self._loading,
+                "draining_versions": [
+                    {"version": model.version, "active_requests": model.active_requests}
+                    for model in self._draining.values()
+                ],
+                "last_error": self.last_error,
+            }
@@ -2,7 +2,6 @@ import sys
 import re
 import numpy as np
 import os
-from presidio_analyzer import AnalyzerEngine
 
 def is_clean_word(word):
     """Check if word is clean, canonical English word suitable for PII detection"""
@@ -54,8 +53,9 @@ def preprocess_embeddings(input_file, output_file):
     pii_count = 0
     total_count = 0
     
-    # Initialize presidio analyzer
+    # Initialize presidio analyzer (imported here since loading spaCy is slow)
     print("Initializing Presidio analyzer...")
+    from presidio_analyzer import AnalyzerEngine
     analyzer = AnalyzerEngine()
     
     print(f"Processing embeddings from {input_file}...")
@@ -114,11 +114,11 @@ def preprocess_embeddings(input_file, output_file):
     print(f"Preprocessing complete. PII entity embeddings saved to {output_file}")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
+    if len(sys.argv) != 3 or sys.argv[1] in ("-h", "--help"):
         print("Usage: python preprocess_embeddings.py <input_vec_file> <output_vec_file>")
         print("Example: python preprocess_embeddings.py embeddings/crawl-300d-2M.vec embeddings/pii_entities_crawl-300d-2M.vec")
         print("Note: This will filter embeddings to only include words identified as LOCATION, PERSON, or NRP entities by Presidio.")
-        sys.exit(1)
+        sys.exit(0 if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help") else 1)
     
     input_file = sys.argv[1]
     output_file = sys.argv[2]
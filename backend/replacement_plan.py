@@ -0,0 +1,426 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+
+PLAN_FORMAT_VERSION = 2
+
+
+def build_alias_table(probabilities):
+    """
+    Build a Walker alias table (Vose's method) for a discrete distribution.
+
+    Returns:
+        tuple: (prob, alias) arrays; draw i uniformly, keep it with
+        probability prob[i], otherwise take alias[i]
+    """
+    n = len(probabilities)
+    scaled = np.asarray(probabilities, dtype=float) * n / np.sum(probabilities)
+    prob = np.ones(n)
+    alias = np.arange(n)
+
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        prob[less] = scaled[less]
+        alias[less] = more
+        scaled[more] += scaled[less] - 1.0
+        if scaled[more] < 1.0:
+            small.append(more)
+        else:
+            large.append(more)
+
+    return prob.astype(np.float32), alias.astype(np.int32)
+
+
+def truncate_distribution(probabilities, truncate_mass, max_outcomes=None):
+    """
+    Indices of the outcomes kept after dropping the least likely ones whose
+    total probability is at most truncate_mass, and then all but the
+    max_outcomes most likely (zero-probability outcomes are always dropped).
+
+    Returns:
+        tuple: (kept indices in ascending order, dropped probability mass)
+    """
+    order = np.argsort(probabilities, kind="stable")
+    cumulative = np.cumsum(probabilities[order])
+    dropped = np.searchsorted(cumulative, truncate_mass, side="right")
+    if max_outcomes is not None:
+        dropped = max(dropped, len(order) - max_outcomes)
+    keep = np.sort(order[dropped:])
+    keep = keep[probabilities[keep] > 0]
+    dropped_mask = np.ones(len(probabilities), dtype=bool)
+    dropped_mask[keep] = False
+    return keep, float(np.sum(probabilities[dropped_mask]))
+
+
+class PlanArrayWriter:
+    """
+    Append-only 1-D .npy array written through a memory map, so a plan never
+    has to fit in memory. The capacity is an upper bound (the file is sparse
+    until written); close() copies the used part into the final file.
+    """
+
+    COPY_BLOCK = 1 << 22
+
+    def __init__(self, path, dtype, capacity):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self._partial_path = f"{path}.partial"
+        self._array = np.lib.format.open_memmap(
+            self._partial_path, mode="w+", dtype=self.dtype, shape=(max(int(capacity), 1),)
+        )
+
+    def append(self, values):
+        end = self.length + len(values)
+        self._array[self.length:end] = values
+        self.length = end
+
+    def view(self, start, end):
+        return self._array[start:end]
+
+    def close(self):
+        if self.length == 0:
+            np.save(self.path, np.zeros(0, dtype=self.dtype))
+        else:
+            final = np.lib.format.open_memmap(self.path, mode="w+", dtype=self.dtype, shape=(self.length,))
+            for start in range(0, self.length, self.COPY_BLOCK):
+                end = min(start + self.COPY_BLOCK, self.length)
+                final[start:end] = self._array[start:end]
+            final.flush()
+            del final
+        self.discard()
+
+    def discard(self):
+        """Remove the partial file without writing the final array"""
+        del self._array
+        os.remove(self._partial_path)
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+# Bytes per table entry (cluster or word index, prob, alias) and per table offset
+ENTRY_BYTES = 4 + 4 + 4
+OFFSET_BYTES = 8
+
+# Largest plan compile_replacement_plan writes unless max_bytes is raised
+DEFAULT_MAX_PLAN_BYTES = 4 * 1024 ** 3
+
+
+def check_plan_size(projected_bytes, max_bytes):
+    """Refuse to compile a plan projected to be larger than max_bytes"""
+    if projected_bytes > max_bytes:
+        raise ValueError(
+            f"Projected plan size {format_bytes(projected_bytes)} exceeds max_bytes "
+            f"({format_bytes(max_bytes)}); raise max_bytes, or opt into truncation with "
+            f"truncate_mass, max_clusters or max_words (a truncated plan does not keep "
+            f"the exact epsilon-DP guarantee)"
+        )
+
+
+def compile_replacement_plan(replacer, output_dir, epsilon=None, truncate_mass=0.0, max_clusters=None,
+                             max_words=None, similarity_threshold=90, max_bytes=DEFAULT_MAX_PLAN_BYTES):
+    """
+    Precompute alias tables for replace_word at a fixed epsilon.
+
+    Stage 1 gets one table per target cluster over the selected clusters, and
+    stage 2 one table per (word, selected cluster) over the replacement words,
+    including the resampling of too-similar words. By default the tables are
+    exact, so a plan samples the same distribution as replace_word.
+
+    An exact plan holds about one stage 2 table per (word, cluster) pair,
+    which is quadratic in the vocabulary. Its projected size is checked
+    against max_bytes before the stage 2 tables are written; raise max_bytes
+    to compile a larger plan. Truncation is opt-in: truncate_mass drops the
+    least likely outcomes of each table up to that combined probability, and
+    max_clusters/max_words cap the table sizes (max_clusters also limits
+    stage 2 to the clusters kept in stage 1). A truncated plan does not keep
+    the exact epsilon-DP guarantee; the largest dropped mass per stage is
+    recorded in its metadata.
+
+    Args:
+        replacer: A loaded DeprivacyReplacer
+        output_dir: Directory to write the plan to (.npy arrays plus JSON)
+        epsilon: Privacy parameter (default: replacer.epsilon)
+        truncate_mass: Probability mass that may be dropped per table (default: none)
+        max_clusters: Largest number of clusters kept per stage 1 table
+        max_words: Largest number of words kept per stage 2 table
+        similarity_threshold: Same threshold as is_clean_suggestion
+        max_bytes: Largest projected plan size to compile
+
+    Returns:
+        dict: The plan metadata
+    """
+    if truncate_mass < 0:
+        raise ValueError("truncate_mass must be >= 0")
+
+    epsilon = replacer.epsilon if epsilon is None else float(epsilon)
+    epsilons = np.array([epsilon])
+
+    index = replacer.distribution_index()
+    labels = index["labels"]
+    words = index["words"]
+    offsets = index["offsets"]
+    cluster_positions = index["cluster_positions"]
+    cluster_sizes = np.diff(offsets)
+
+    stage1_capacity = len(labels) * min(len(labels), max_clusters or len(labels))
+    stage2_worst_case = len(words) * int(np.sum(np.minimum(cluster_sizes, max_words or len(words))))
+    stage2_worst_case_bytes = stage2_worst_case * ENTRY_BYTES + len(words) * len(labels) * OFFSET_BYTES
+    print(f"Projected plan size: stage 1 at most {format_bytes(stage1_capacity * ENTRY_BYTES)}, "
+          f"stage 2 at most {format_bytes(stage2_worst_case_bytes)}"
+          + (" before truncation" if truncate_mass > 0 or max_clusters is not None else ""))
+    if truncate_mass > 0 or max_clusters is not None:
+        # Stage 2 depends on what stage 1 keeps; it is checked once stage 1 is compiled
+        check_plan_size(stage1_capacity * ENTRY_BYTES, max_bytes)
+    else:
+        check_plan_size(stage1_capacity * ENTRY_BYTES + stage2_worst_case_bytes, max_bytes)
+
+    os.makedirs(output_dir, exist_ok=True)
+    # meta.json is written last, so a plan being (re)compiled is never loaded
+    if os.path.exists(os.path.join(output_dir, "meta.json")):
+        os.remove(os.path.join(output_dir, "meta.json"))
+
+    def path(name):
+        return os.path.join(output_dir, f"{name}.npy")
+
+    stage1_offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+    stage1_clusters = PlanArrayWriter(path("stage1_clusters"), np.int32, stage1_capacity)
+    stage1_prob = PlanArrayWriter(path("stage1_prob"), np.float32, stage1_capacity)
+    stage1_alias = PlanArrayWriter(path("stage1_alias"), np.int32, stage1_capacity)
+    max_stage1_dropped = 0.0
+
+    print(f"Compiling stage 1 tables for {len(labels)} clusters...")
+    for position, label in enumerate(labels):
+        _, stage1, _, _, _ = replacer.stage_probabilities(
+            "", label, epsilons, similarity_threshold, cluster_subset=[]
+        )
+        support, dropped = truncate_distribution(stage1[0], truncate_mass, max_clusters)
+        max_stage1_dropped = max(max_stage1_dropped, dropped)
+
+        prob, alias = build_alias_table(stage1[0][support])
+        stage1_clusters.append(support)
+        stage1_prob.append(prob)
+        stage1_alias.append(alias)
+        stage1_offsets[position + 1] = stage1_clusters.length
+
+    # Now the stage 1 supports are known: one stage 2 table per (word, kept cluster)
+    support_sizes = np.diff(stage1_offsets)
+    support_words = np.array([
+        np.sum(np.minimum(cluster_sizes[stage1_clusters.view(stage1_offsets[c], stage1_offsets[c + 1])],
+                          max_words or len(words)))
+        for c in range(len(labels))
+    ], dtype=np.int64)
+    table_count = int(np.sum(cluster_sizes * support_sizes))
+    stage2_capacity = int(np.sum(cluster_sizes * support_words))
+    stage2_bytes = stage2_capacity * ENTRY_BYTES + table_count * OFFSET_BYTES
+    print(f"Projected stage 2 size: {table_count} tables, at most {format_bytes(stage2_bytes)}")
+    try:
+        check_plan_size(stage1_clusters.length * ENTRY_BYTES + stage2_bytes, max_bytes)
+    except ValueError:
+        for writer in (stage1_clusters, stage1_prob, stage1_alias):
+            writer.discard()
+        raise
+
+    stage2_table_start = np.zeros(len(words) + 1, dtype=np.int64)
+    stage2_offsets = np.lib.format.open_memmap(
+        path("stage2_offsets"), mode="w+", dtype=np.int64, shape=(table_count + 1,)
+    )
+    stage2_offsets[0] = 0
+    stage2_words = PlanArrayWriter(path("stage2_words"), np.int32, stage2_capacity)
+    stage2_prob = PlanArrayWriter(path("stage2_prob"), np.float32, stage2_capacity)
+    stage2_alias = PlanArrayWriter(path("stage2_alias"), np.int32, stage2_capacity)
+    max_stage2_dropped = 0.0
+    table = 0
+
+    print(f"Compiling stage 2 tables for {len(words)} words...")
+    start_time = time.time()
+    for word_position, word in enumerate(words):
+        if word_position and word_position % 10000 == 0:
+            print(f"Compiled {word_position} words ({time.time() - start_time:.0f}s)")
+
+        position = cluster_positions[word_position]
+        support = np.array(stage1_clusters.view(stage1_offsets[position], stage1_offsets[position + 1]))
+        stage2_table_start[word_position] = table
+
+        _, _, stage2, _, word_positions = replacer.stage_probabilities(
+            word, labels[position], epsilons, similarity_threshold, cluster_subset=support
+        )
+        segment_offsets = np.concatenate([[0], np.cumsum(cluster_sizes[support])])
+
+        for k in range(len(support)):
+            segment = slice(segment_offsets[k], segment_offsets[k + 1])
+            kept, dropped = truncate_distribution(stage2[0, segment], truncate_mass, max_words)
+            max_stage2_dropped = max(max_stage2_dropped, dropped)
+
+            if len(kept):
+                prob, alias = build_alias_table(stage2[0, segment][kept])
+                stage2_words.append(word_positions[segment][kept])
+                stage2_prob.append(prob)
+                stage2_alias.append(alias)
+            table += 1
+            stage2_offsets[table] = stage2_words.length
+
+    stage2_table_start[len(words)] = table
+    stage2_offsets.flush()
+    del stage2_offsets
+
+    for writer in (stage1_clusters, stage1_prob, stage1_alias, stage2_words, stage2_prob, stage2_alias):
+        writer.close()
+    np.save(path("stage1_offsets"), stage1_offsets)
+    np.save(path("word_clusters"), cluster_positions.astype(np.int32))
+    np.save(path("stage2_table_start"), stage2_table_start)
+    with open(os.path.join(output_dir, "words.json"), "w", encoding="utf-8") as f:
+        json.dump(words, f)
+
+    meta = {
+        "format_version": PLAN_FORMAT_VERSION,
+        "epsilon": epsilon,
+        "truncate_mass": truncate_mass,
+        "max_clusters": max_clusters,
+        "max_words": max_words,
+        "similarity_threshold": similarity_threshold,
+        "clusters_file": os.path.realpath(replacer.clusters_file),
+        "embeddings_file": os.path.realpath(replacer.embeddings_file),
+        "distance_metric": replacer.distance_metric,
+        "dp_type": replacer.dp_type,
+        "K": replacer.K,
+        "model_fingerprint": replacer.model_fingerprint(),
+        "labels": [int(label) for label in labels],
+        "num_words": len(words),
+        "num_stage2_tables": table,
+        "num_stage2_entries": stage2_words.length,
+        "max_stage1_dropped_mass": max_stage1_dropped,
+        "max_stage2_dropped_mass": max_stage2_dropped,
+    }
+    with open(os.path.join(output_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    return meta
+
+
+class ReplacementPlan:
+    """
+    Compiled replacement plan, memory-mapped from disk.
+
+    replace_word makes two constant-time alias draws, one for the cluster
+    and one for the word, instead of recomputing the exponential mechanism.
+    """
+
+    def __init__(self, plan_dir):
+        self.plan_dir = plan_dir
+
+        with open(os.path.join(plan_dir, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != PLAN_FORMAT_VERSION:
+            raise ValueError(f"Unsupported replacement plan format in {plan_dir}")
+
+        with open(os.path.join(plan_dir, "words.json"), "r", encoding="utf-8") as f:
+            self.words = json.load(f)
+        self.word_positions = {word: position for position, word in enumerate(self.words)}
+
+        self.epsilon = self.meta["epsilon"]
+        self.labels = self.meta["labels"]
+
+        def load(name):
+            return np.load(os.path.join(plan_dir, f"{name}.npy"), mmap_mode="r")
+
+        self.stage1_offsets = load("stage1_offsets")
+        self.stage1_clusters = load("stage1_clusters")
+        self.stage1_prob = load("stage1_prob")
+        self.stage1_alias = load("stage1_alias")
+        self.word_clusters = load("word_clusters")
+        self.stage2_table_start = load("stage2_table_start")
+        self.stage2_offsets = load("stage2_offsets")
+        self.stage2_words = load("stage2_words")
+        self.stage2_prob = load("stage2_prob")
+        self.stage2_alias = load("stage2_alias")
+
+    @staticmethod
+    def _draw(start, end, prob, alias):
+        """Alias draw from the table stored in [start, end); returns the local index"""
+        scaled = np.random.random() * (end - start)
+        i = int(scaled)
+        return i if scaled - i < prob[start + i] else int(alias[start + i])
+
+    def replace_word(self, target_word):
+        """
+        Sample a replacement like DeprivacyReplacer.replace_word.
+
+        Returns:
+            tuple: (replacement_word, target_cluster_id, selected_cluster_id), or
+            None if the word is not in the plan (the caller should fall back)
+        """
+        word_position = self.word_positions.get(target_word.lower())
+        if word_position is None:
+            return None
+
+        position = int(self.word_clusters[word_position])
+        start, end = int(self.stage1_offsets[position]), int(self.stage1_offsets[position + 1])
+        if start == end:
+            return None
+        k = self._draw(start, end, self.stage1_prob, self.stage1_alias)
+        selected_position = int(self.stage1_clusters[start + k])
+
+        table = int(self.stage2_table_start[word_position]) + k
+        start, end = int(self.stage2_offsets[table]), int(self.stage2_offsets[table + 1])
+        if start == end:
+            return None, self.labels[position], self.labels[selected_position]
+
+        j = self._draw(start, end, self.stage2_prob, self.stage2_alias)
+        replacement_word = self.words[int(self.stage2_words[start + j])]
+        return replacement_word, self.labels[position], self.labels[selected_position]
+
+
+if __name__ == "__main__":
+    options = {"--max-gb": None, "--truncate-mass": None, "--max-clusters": None, "--max-words": None}
+    args = []
+    argv = iter(sys.argv[1:])
+    for arg in argv:
+        if arg in options:
+            options[arg] = next(argv, None)
+        else:
+            args.append(arg)
+
+    if len(args) != 2 or args[0] in ("-h", "--help") or any(
+            name in sys.argv and value is None for name, value in options.items()):
+        print("Usage: python replacement_plan.py <output_dir> <epsilon> [--max-gb GB] "
+              "[--truncate-mass MASS] [--max-clusters N] [--max-words N]")
+        print("Example: python replacement_plan.py plans/epsilon-20 20.0")
+        print(f"Compiles exact tables, refusing plans projected above "
+              f"{format_bytes(DEFAULT_MAX_PLAN_BYTES)} unless --max-gb is raised.")
+        print("--truncate-mass, --max-clusters and --max-words opt into truncated tables, "
+              "which do not keep the exact epsilon-DP guarantee.")
+        print("Note: Load the plan with DeprivacyReplacer(epsilon=..., plan_dir=...) "
+              "or DEPRIVACY_REPLACEMENT_PLAN_DIR for the server.")
+        sys.exit(0 if args[:1] in (["-h"], ["--help"]) else 1)
+
+    from deprivacy_replacer import DeprivacyReplacer
+
+    output_dir = args[0]
+    epsilon = float(args[1])
+    max_bytes = int(float(options["--max-gb"]) * 1024 ** 3) if options["--max-gb"] else DEFAULT_MAX_PLAN_BYTES
+    truncate_mass = float(options["--truncate-mass"]) if options["--truncate-mass"] else 0.0
+    max_clusters = int(options["--max-clusters"]) if options["--max-clusters"] else None
+    max_words = int(options["--max-words"]) if options["--max-words"] else None
+
+    replacer = DeprivacyReplacer(epsilon=epsilon)
+    meta = compile_replacement_plan(
+        replacer, output_dir, epsilon=epsilon, truncate_mass=truncate_mass,
+        max_clusters=max_clusters, max_words=max_words, max_bytes=max_bytes,
+    )
+
+    print(f"Replacement plan saved to {output_dir}: {meta['num_words']} words, "
+          f"{meta['num_stage2_tables']} stage 2 tables with {meta['num_stage2_entries']} entries, "
+          f"max dropped mass {meta['max_stage1_dropped_mass']:.2e} (stage 1) / "
+          f"{meta['max_stage2_dropped_mass']:.2e} (stage 2)")
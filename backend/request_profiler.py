@@ -0,0 +1,81 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import itertools
+import threading
+
+
+class RequestProfiler:
+    """
+    Opt-in cProfile tracing of individual requests.
+
+    A request is profiled when it explicitly asks for it (the app only allows
+    this for admins) or when it is the N-th request and sample_every is N.
+    Only one request is profiled at a time, since the interpreter supports a
+    single active profiler; others run unprofiled. When nothing is enabled
+    the per-request cost is a counter increment.
+    """
+
+    def __init__(self, sample_every=0, output_dir=None, top_n=20):
+        self.sample_every = sample_every
+        self.output_dir = output_dir
+        self.top_n = top_n
+
+        self._counter = itertools.count(1)
+        self._busy = threading.Lock()
+
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+    def should_sample(self):
+        """Whether this request is picked by 1-in-N sampling"""
+        return self.sample_every > 0 and next(self._counter) % self.sample_every == 0
+
+    def start(self):
+        """Start profiling the current request, or return None if another one is being profiled"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.start_time = time.perf_counter()
+        profile.enable()
+        return profile
+
+    def stop(self, profile):
+        """Stop profiling and return a summary of the hottest functions"""
+        profile.disable()
+        elapsed = time.perf_counter() - profile.start_time
+        self._busy.release()
+
+        stats = pstats.Stats(profile)
+        rows = []
+        for (filename, line, name), (_, calls, total_time, cumulative_time, _) in stats.stats.items():
+            rows.append({
+                "function": f"{name} ({os.path.basename(filename)}:{line})" if line else name,
+                "calls": calls,
+                "total_time": round(total_time, 6),
+                "cumulative_time": round(cumulative_time, 6),
+            })
+        rows.sort(key=lambda row: row["cumulative_time"], reverse=True)
+
+        return {
+            "elapsed_seconds": round(elapsed, 6),
+            "top_functions": rows[:self.top_n],
+        }
+
+    def save(self, profile, summary, name):
+        """Write the raw profile (for pstats/snakeviz) and its summary to output_dir"""
+        if not self.output_dir:
+            return None
+
+        base_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{threading.get_ident()}"
+        base_path = os.path.join(self.output_dir, base_name)
+        try:
+            profile.dump_stats(f"{base_path}.prof")
+            with open(f"{base_path}.json", "w") as f:
+                json.dump(summary, f, indent=2)
+        except OSError as e:
+            print(f"Warning: Could not write request profile: {e}")
+            return None
+        return base_path
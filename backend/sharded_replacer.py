@@ -0,0 +1,317 @@
+import bisect
+import threading
+import multiprocessing
+import numpy as np
+from deprivacy_replacer import DeprivacyReplacer
+
+# Calls the router may make on a shard
+SHARD_METHODS = {"select_word", "warm_up"}
+
+# Seconds the router waits for a shard's answer before marking it failed;
+# warm-up builds the shard's tables, so it gets longer
+CALL_TIMEOUT_SECONDS = 30
+WARM_UP_TIMEOUT_SECONDS = 600
+
+
+class ShardedModeError(RuntimeError):
+    """A DeprivacyReplacer feature that needs every embedding in one process"""
+
+
+def run_shard(conn, config):
+    """
+    Shard process: load a DeprivacyReplacer for one cluster range and answer
+    (method, args) calls from the router over the pipe until told to close.
+    """
+    # Do not share the parent's random state across shards
+    np.random.seed()
+
+    try:
+        shard = DeprivacyReplacer(**config)
+        conn.send(("ok", {
+            "centroids": shard.calculate_centroids(),
+            "num_embeddings": shard.num_embeddings,
+        }))
+    except Exception as e:
+        conn.send(("error", f"Failed to load shard: {str(e)}"))
+        conn.close()
+        return
+
+    while True:
+        try:
+            method, args = conn.recv()
+        except EOFError:
+            break
+
+        if method == "close":
+            break
+        if method == "get_embeddings":
+            # Embeddings of the given words that this shard owns
+            conn.send(("ok", {word: shard.embeddings.get(word) for word in args}))
+            continue
+        if method not in SHARD_METHODS:
+            conn.send(("error", f"Unknown shard method: {method}"))
+            continue
+
+        try:
+            conn.send(("ok", getattr(shard, method)(*args)))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+    conn.close()
+
+
+class ShardedReplacer(DeprivacyReplacer):
+    """
+    DeprivacyReplacer whose embeddings and stage-2 data are split across
+    local shard processes, each owning a contiguous range of cluster labels.
+
+    The router keeps only the clusters' words and centroids: it selects the
+    cluster (stage 1) itself and sends the word selection (stage 2) to the
+    shard that owns the selected cluster. Shards are spawned as local
+    processes and talk to the router over pipes.
+    """
+
+    # Exact distributions need every embedding in one process
+    supports_distributions = False
+
+    def __init__(
+        self,
+        clusters_file="clustering/clusters/embeddings_clusters.json",
+        embeddings_file="embeddings/pii_entities_crawl-300d-2M.vec",
+        epsilon=1.0,
+        distance_metric="euclidean",
+        dp_type="metric",
+        K=1,
+        plan_dir=None,
+        num_shards=2,
+    ):
+        self.num_shards = num_shards
+
+        # Compiled plans cover the whole model, so they are not used by the router
+        if plan_dir:
+            print("Warning: Replacement plans are not supported in sharded mode; ignoring it")
+
+        super().__init__(clusters_file, embeddings_file, epsilon, distance_metric, dp_type, K)
+
+    def load_model(self):
+        """Load the clusters on the router and start the shards holding the embeddings"""
+        # The router holds words and centroids only; embeddings live in the shards
+        vocabulary = self.load_vocabulary() if self.clusters_file.endswith(".npz") else None
+        self.clusters = self.load_clusters(vocabulary)
+        self.embeddings = {}
+        self.word_clusters = {
+            word: label for label, words in self.clusters.items() for word in words
+        }
+        self._inter_cluster_sensitivity = None
+
+        self.labels = sorted(self.clusters.keys())
+        self.label_positions = {label: position for position, label in enumerate(self.labels)}
+        self.shard_ranges = self.partition_clusters(self.num_shards)
+        self.shard_starts = [start for start, _ in self.shard_ranges]
+
+        self.shards = []
+        # Shard index -> reason, for shards that stopped answering
+        self.failed_shards = {}
+        self._num_embeddings = 0
+        self.centroids = None
+        self.start_shards()
+
+    def partition_clusters(self, num_shards):
+        """Split the sorted cluster labels into contiguous ranges with similar word counts"""
+        if not self.labels:
+            return []
+
+        num_shards = max(1, min(num_shards, len(self.labels)))
+        total_words = sum(len(self.clusters[label]) for label in self.labels)
+        ranges = []
+        start = self.labels[0]
+        words_so_far = 0
+
+        for i, label in enumerate(self.labels):
+            words_so_far += len(self.clusters[label])
+            shards_left = num_shards - len(ranges) - 1
+            labels_left = len(self.labels) - i - 1
+            if shards_left == 0 or labels_left == 0:
+                continue
+            if words_so_far >= total_words * (len(ranges) + 1) / num_shards or labels_left == shards_left:
+                ranges.append((start, self.labels[i + 1]))
+                start = self.labels[i + 1]
+
+        ranges.append((start, self.labels[-1] + 1))
+        return ranges
+
+    def start_shards(self):
+        """Spawn one process per cluster range and collect their centroids"""
+        context = multiprocessing.get_context("spawn")
+
+        for shard_index, cluster_range in enumerate(self.shard_ranges):
+            router_conn, shard_conn = context.Pipe()
+            config = {
+                "clusters_file": self.clusters_file,
+                "embeddings_file": self.embeddings_file,
+                "epsilon": self.epsilon,
+                "distance_metric": self.distance_metric,
+                "dp_type": self.dp_type,
+                "K": self.K,
+                "cluster_range": cluster_range,
+            }
+            process = context.Process(
+                target=run_shard, args=(shard_conn, config),
+                name=f"deprivacy-shard-{shard_index}", daemon=True,
+            )
+            process.start()
+            shard_conn.close()
+            self.shards.append((process, router_conn, threading.Lock()))
+            print(f"Started shard {shard_index} for clusters {cluster_range[0]}-{cluster_range[1] - 1} "
+                  f"(pid {process.pid})")
+
+        centroids = {}
+        for shard_index, (_, conn, _) in enumerate(self.shards):
+            status, result = conn.recv()
+            if status != "ok":
+                self.close()
+                raise RuntimeError(f"Shard {shard_index}: {result}")
+            centroids.update(result["centroids"])
+            self._num_embeddings += result["num_embeddings"]
+
+        # Clusters without any embedded word get a zero centroid, as in calculate_centroids
+        embedding_dim = len(next(iter(centroids.values()))) if centroids else 0
+        self.centroids = np.array([
+            centroids.get(label, np.zeros(embedding_dim)) for label in self.labels
+        ])
+        print(f"{len(self.shards)} shards ready with {self._num_embeddings} embeddings")
+
+    def _call(self, shard_index, method, *args, timeout=CALL_TIMEOUT_SECONDS):
+        """Call a method on a shard and wait up to timeout seconds for its result"""
+        if shard_index in self.failed_shards:
+            raise RuntimeError(f"Shard {shard_index} is unavailable: {self.failed_shards[shard_index]}")
+
+        process, conn, lock = self.shards[shard_index]
+        with lock:
+            try:
+                conn.send((method, args))
+                if not conn.poll(timeout):
+                    # A late answer would be read as the reply to the next call, so the shard is retired
+                    process.kill()
+                    reason = f"shard process {process.pid} did not answer {method} within {timeout}s"
+                    raise self._shard_failed(shard_index, reason)
+                status, result = conn.recv()
+            except (EOFError, OSError) as e:
+                # The pipe closes when the shard process exits, e.g. after a crash
+                reason = f"shard process {process.pid} stopped (exit code {process.exitcode}, {type(e).__name__})"
+                raise self._shard_failed(shard_index, reason) from None
+        if status != "ok":
+            raise RuntimeError(f"Shard {shard_index}: {result}")
+        return result
+
+    def _shard_failed(self, shard_index, reason):
+        """Record a shard as failed and return the error to raise"""
+        self.failed_shards[shard_index] = reason
+        print(f"Error: Shard {shard_index} failed: {reason}")
+        return RuntimeError(f"Shard {shard_index} is unavailable: {reason}")
+
+    @property
+    def healthy(self):
+        """False once any shard has stopped answering"""
+        return not self.failed_shards
+
+    def shard_for_cluster(self, label):
+        """Index of the shard owning a cluster label"""
+        return bisect.bisect_right(self.shard_starts, label) - 1
+
+    @property
+    def num_embeddings(self):
+        return self._num_embeddings
+
+    @property
+    def inter_distances(self):
+        raise ShardedModeError("Inter-cluster distances are computed per request in sharded mode")
+
+    @property
+    def inter_cluster_sensitivity(self):
+        if self._inter_cluster_sensitivity is None:
+            with self._tables_lock:
+                if self._inter_cluster_sensitivity is None:
+                    self._inter_cluster_sensitivity = self.calculate_inter_cluster_sensitivity()
+        return self._inter_cluster_sensitivity
+
+    def calculate_inter_cluster_sensitivity(self):
+        """Largest centroid distance for "standard" DP, computed in row blocks"""
+        if self.dp_type != "standard" or len(self.labels) == 0:
+            return 1.0
+
+        from scipy.spatial.distance import cdist
+
+        max_distance = 0.0
+        for start in range(0, len(self.centroids), 1024):
+            block = cdist(self.centroids[start:start + 1024], self.centroids, metric=self.distance_metric)
+            max_distance = max(max_distance, float(block.max()))
+        return max_distance
+
+    def warm_up(self):
+        """Calculate the router's sensitivity and each shard's tables now"""
+        self.inter_cluster_sensitivity
+        for shard_index in range(len(self.shards)):
+            self._call(shard_index, "warm_up", timeout=WARM_UP_TIMEOUT_SECONDS)
+
+    def find_word_cluster(self, word):
+        """Find which cluster a word belongs to"""
+        return self.word_clusters.get(word.lower())
+
+    def get_embedding(self, word):
+        """Fetch a word's embedding from the shard owning its cluster"""
+        label = self.word_clusters.get(word)
+        if label is None:
+            return None
+        return self._call(self.shard_for_cluster(label), "get_embeddings", word).get(word)
+
+    def select_cluster(self, target_cluster_label):
+        """Stage 1 on the router, with centroid distances computed for this row only"""
+        if len(self.clusters) == 1:
+            return target_cluster_label
+
+        from scipy.spatial.distance import cdist
+
+        position = self.label_positions[target_cluster_label]
+        distances_from_cluster = cdist(
+            self.centroids[position:position + 1], self.centroids, metric=self.distance_metric
+        )[0]
+        probabilities = self.exponential_mechanism(
+            -distances_from_cluster, self.inter_cluster_sensitivity
+        )
+        return self.labels[np.random.choice(len(self.labels), p=probabilities)]
+
+    def select_word(self, target_word_lower, target_word_embedding, selected_cluster_label):
+        """Stage 2 on the shard owning the selected cluster"""
+        return self._call(
+            self.shard_for_cluster(selected_cluster_label), "select_word",
+            target_word_lower, target_word_embedding, selected_cluster_label,
+        )
+
+    def distribution_index(self):
+        raise ShardedModeError("Exact distributions and replacement plans are not available in sharded mode")
+
+    def stage_probabilities(self, *args, **kwargs):
+        raise ShardedModeError("Exact distributions are not available in sharded mode")
+
+    def replacement_distribution(self, *args, **kwargs):
+        raise ShardedModeError("Exact distributions are not available in sharded mode")
+
+    def close(self):
+        """Stop all shard processes"""
+        for process, conn, lock in self.shards:
+            with lock:
+                try:
+                    conn.send(("close", ()))
+                except (OSError, ValueError):
+                    pass
+                conn.close()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=5)
+            if process.is_alive():
+                # A stopped or hung process may not act on SIGTERM
+                process.kill()
+                process.join()
+        self.shards = []
@@ -0,0 +1,175 @@
+import sys
+import json
+import os
+import tempfile
+import collections
+import numpy as np
+
+# Run from the backend directory: python verify_replacement_distribution.py [samples]
+#
+# Builds a small synthetic model and checks that
+# DeprivacyReplacer.replacement_distribution matches the frequencies of
+# sampled replace_word calls, and that replacements drawn from a compiled
+# replacement plan or through shard processes follow the same distribution.
+
+# Outcomes whose sampled frequency is further than this many standard errors
+# from the exact probability fail the check
+Z_TOLERANCE = 5.0
+
+# Words checked on the synthetic model: close spellings (resampling of
+# too-similar replacements), a word without an embedding (uniform stage 2)
+# and clusters without embedded words (no replacement)
+CHECK_WORDS = ["anna", "annabel", "paris", "ghost"]
+
+
+def build_synthetic_model(directory, seed=0):
+    """
+    Write a small embeddings file and clusters file to directory.
+
+    Returns:
+        tuple: (clusters_file, embeddings_file)
+    """
+    rng = np.random.RandomState(seed)
+    clusters = {
+        0: ["anna", "annabel", "anne", "hannah", "john", "johnny", "jon", "mark", "marko", "mary"],
+        1: ["paris", "london", "berlin", "rome", "romeo", "madrid", "lisbon", "oslo", "vienna", "prague"],
+        2: ["alice", "bob", "carol", "dave", "eve", "frank", "grace", "heidi", "ivan", "judy"],
+        3: ["christian", "muslim", "jewish", "hindu", "buddhist", "sikh", "catholic", "protestant"],
+        4: ["ghost", "phantom"],
+        5: ["unembedded"],
+    }
+    # Words without a vector: "ghost" (uniform stage 2) and cluster 5 (empty cluster)
+    missing = {"ghost", "unembedded"}
+
+    centers = rng.normal(scale=3.0, size=(len(clusters), 8))
+    lines = []
+    for label, words in clusters.items():
+        for word in words:
+            if word not in missing:
+                vector = centers[label] + rng.normal(size=8)
+                lines.append(word + " " + " ".join(f"{x:.4f}" for x in vector))
+
+    embeddings_file = os.path.join(directory, "embeddings.vec")
+    with open(embeddings_file, "w", encoding="utf-8") as f:
+        f.write(f"{len(lines)} 8\n")
+        f.write("\n".join(lines) + "\n")
+
+    clusters_file = os.path.join(directory, "clusters.json")
+    with open(clusters_file, "w") as f:
+        json.dump(clusters, f)
+
+    return clusters_file, embeddings_file
+
+
+def exact_distribution(replacer, word, epsilon):
+    """P(replacement) for every possible replacement of word, with None for no replacement"""
+    result = replacer.replacement_distribution([word], [epsilon], top_k=replacer.num_embeddings)[0]
+    stats = result["distributions"][0]
+    probabilities = {entry["replacement"]: entry["probability"] for entry in stats["replacements"]}
+    if stats["no_replacement_probability"] > 0:
+        probabilities[None] = stats["no_replacement_probability"]
+    return probabilities
+
+
+def sampled_frequencies(sample, samples):
+    """Relative frequency of each value returned by sample()"""
+    counts = collections.Counter(sample() for _ in range(samples))
+    return {value: count / samples for value, count in counts.items()}
+
+
+def compare(expected, frequencies, samples, slack=0.0):
+    """
+    Problems found comparing exact probabilities with sampled frequencies;
+    slack is extra probability each outcome may be off by (e.g. truncated mass).
+    """
+    problems = []
+    for outcome in set(expected) | set(frequencies):
+        p = expected.get(outcome, 0.0)
+        frequency = frequencies.get(outcome, 0.0)
+        tolerance = Z_TOLERANCE * np.sqrt(p * (1 - p) / samples) + 1.0 / samples + slack
+        if abs(frequency - p) > tolerance:
+            problems.append(f"{outcome!r}: sampled {frequency:.4f}, expected {p:.4f}")
+    return problems
+
+
+def report(name, word, problems):
+    status = "FAIL" if problems else "ok"
+    print(f"{name:<28} {word:<10} {status}  {'; '.join(problems[:3])}")
+    return bool(problems)
+
+
+def check_exact_distribution(replacer, words, epsilon, samples):
+    """replacement_distribution against sampled DeprivacyReplacer.replace_word"""
+    failures = 0
+    for word in words:
+        expected = exact_distribution(replacer, word, epsilon)
+        frequencies = sampled_frequencies(lambda: replacer.replace_word(word)[0], samples)
+        failures += report("exact distribution", word, compare(expected, frequencies, samples))
+    return failures
+
+
+def check_plan(replacer, words, epsilon, samples, plan_dir):
+    """Replacements drawn from a compiled plan against replacement_distribution"""
+    from deprivacy_replacer import DeprivacyReplacer
+    from replacement_plan import compile_replacement_plan
+
+    meta = compile_replacement_plan(replacer, plan_dir, epsilon=epsilon)
+    planned = DeprivacyReplacer(
+        clusters_file=replacer.clusters_file, embeddings_file=replacer.embeddings_file,
+        epsilon=epsilon, plan_dir=plan_dir,
+    )
+    slack = meta["max_stage1_dropped_mass"] + meta["max_stage2_dropped_mass"]
+
+    failures = 0
+    for word in words:
+        expected = exact_distribution(replacer, word, epsilon)
+        frequencies = sampled_frequencies(lambda: planned.replace_word(word)[0], samples)
+        failures += report("replacement plan", word, compare(expected, frequencies, samples, slack))
+    return failures
+
+
+def check_sharded(replacer, words, epsilon, samples, num_shards=3):
+    """Replacements made through ShardedReplacer against replacement_distribution"""
+    from sharded_replacer import ShardedReplacer
+
+    sharded = ShardedReplacer(
+        clusters_file=replacer.clusters_file, embeddings_file=replacer.embeddings_file,
+        epsilon=epsilon, num_shards=num_shards,
+    )
+    failures = 0
+    try:
+        for word in words:
+            expected = exact_distribution(replacer, word, epsilon)
+            frequencies = sampled_frequencies(lambda: sharded.replace_word(word)[0], samples)
+            failures += report(f"{num_shards} shards", word, compare(expected, frequencies, samples))
+    finally:
+        sharded.close()
+    return failures
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 or (len(sys.argv) == 2 and not sys.argv[1].isdigit()):
+        print("Usage: python verify_replacement_distribution.py [samples]")
+        print("Checks exact replacement distributions against sampled replacements "
+              "(direct, from a compiled plan and through shard processes) on a synthetic "
+              "model (default: 20000 samples per word)")
+        sys.exit(0 if len(sys.argv) == 2 and sys.argv[1] in ("-h", "--help") else 1)
+
+    from deprivacy_replacer import DeprivacyReplacer
+
+    samples = int(sys.argv[1]) if len(sys.argv) == 2 else 20000
+    epsilon = 3.0
+    np.random.seed(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        clusters_file, embeddings_file = build_synthetic_model(directory)
+        replacer = DeprivacyReplacer(
+            clusters_file=clusters_file, embeddings_file=embeddings_file, epsilon=epsilon
+        )
+
+        print(f"Checking with {samples} samples per word at epsilon={epsilon}")
+        failures = check_exact_distribution(replacer, CHECK_WORDS, epsilon, samples)
+        failures += check_plan(replacer, CHECK_WORDS, epsilon, samples, os.path.join(directory, "plan"))
+        failures += check_sharded(replacer, CHECK_WORDS, epsilon, samples)
+
+    sys.exit(1 if failures else 0)
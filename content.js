@@ -60,21 +60,27 @@ class DeprivacyContentScript {
     }
   }
 
-  handleReplaceTextareas(processedTextareas, sendResponse) {
+  async handleReplaceTextareas(processedTextareas, sendResponse) {
     try {
       const textareas = document.querySelectorAll('textarea');
       let replacedCount = 0;
       let totalAttempts = 0;
 
-      processedTextareas.forEach(processedData => {
+      for (const processedData of processedTextareas) {
         totalAttempts++;
         
         if (processedData.index < textareas.length) {
           const textarea = textareas[processedData.index];
           
-          // Only replace if content actually changed
-          if (processedData.processedContent !== processedData.originalContent) {
-            textarea.value = processedData.processedContent;
+          // Only replace if there is something to change
+          if (processedData.edits && processedData.edits.length > 0) {
+            // Skip textareas edited since extraction, the offsets no longer apply
+            if (!(await this.isUnchanged(textarea.value || '', processedData))) {
+              console.warn(`Textarea ${processedData.index} changed during processing, skipping`);
+              continue;
+            }
+
+            this.applyEdits(textarea, processedData.edits);
             
             // Trigger input event to notify any listeners
             textarea.dispatchEvent(new Event('input', { bubbles: true }));
@@ -85,14 +91,14 @@ class DeprivacyContentScript {
             // Add visual feedback - briefly highlight the textarea
             this.highlightTextarea(textarea);
             
-            console.log(`Replaced content in textarea ${processedData.index}`);
+            console.log(`Replaced ${processedData.edits.length} span(s) in textarea ${processedData.index}`);
           } else {
             console.log(`No changes needed for textarea ${processedData.index}`);
           }
         } else {
           console.warn(`Textarea index ${processedData.index} not found`);
         }
-      });
+      }
 
       console.log(`Replacement complete: ${replacedCount}/${totalAttempts} textareas updated`);
       sendResponse({
@@ -110,6 +116,42 @@ class DeprivacyContentScript {
     }
   }
 
+  // Apply backend edits ({ start, end, replacement } in original text offsets).
+  // Edits are applied back to front so earlier offsets stay valid.
+  applyEdits(textarea, edits) {
+    const ordered = [...edits].sort((a, b) => b.start - a.start);
+    ordered.forEach(edit => {
+      textarea.setRangeText(edit.replacement, edit.start, edit.end, 'preserve');
+    });
+  }
+
+  // Whether the textarea still holds the text the edits were computed for.
+  // Uses the backend hash where Web Crypto is available, and otherwise the
+  // extracted original text; with neither, the textarea is treated as changed.
+  async isUnchanged(text, processedData) {
+    const currentHash = await this.hashText(text);
+    if (currentHash !== null && processedData.contentHash) {
+      return currentHash === processedData.contentHash;
+    }
+    if (typeof processedData.originalContent === 'string') {
+      return text === processedData.originalContent;
+    }
+    return false;
+  }
+
+  // SHA-256 hex digest of the UTF-8 text, matching the backend content_hash.
+  // Returns null where Web Crypto is unavailable (pages not in a secure context).
+  async hashText(text) {
+    if (!window.crypto || !window.crypto.subtle) {
+      return null;
+    }
+    const data = new TextEncoder().encode(text);
+    const digest = await crypto.subtle.digest('SHA-256', data);
+    return Array.from(new Uint8Array(digest))
+      .map(byte => byte.toString(16).padStart(2, '0'))
+      .join('');
+  }
+
   highlightTextarea(textarea) {
     // Store original styles
     const originalBackgroundColor = textarea.style.backgroundColor;
@@ -55,19 +55,21 @@ class DeprivacyPopup {
         this.showStatus(`Processing textarea ${i + 1}/${textareas.length}...`, 'info');
         
         try {
-          const processedText = await this.processTextWithBackend(textarea.content);
+          const { edits, contentHash } = await this.processTextWithBackend(textarea.content);
           processedTextareas.push({
             index: textarea.index,
+            contentHash: contentHash,
+            // Compared directly where the page cannot compute the hash
             originalContent: textarea.content,
-            processedContent: processedText
+            edits: edits
           });
         } catch (error) {
           console.error(`Error processing textarea ${i + 1}:`, error);
           // Keep original content if processing fails
           processedTextareas.push({
             index: textarea.index,
-            originalContent: textarea.content,
-            processedContent: textarea.content
+            contentHash: null,
+            edits: []
           });
         }
       }
@@ -83,7 +85,7 @@ class DeprivacyPopup {
       }
 
       const replacementCount = processedTextareas.filter(
-        t => t.processedContent !== t.originalContent
+        t => t.edits.length > 0
       ).length;
 
       this.showStatus(
@@ -99,9 +101,11 @@ class DeprivacyPopup {
     }
   }
 
+  // Returns the edits to apply to the original text, as { start, end, replacement }
+  // with offsets in JavaScript string indices, and the hash of the original text
   async processTextWithBackend(text) {
     if (!text || !text.trim()) {
-      return text;
+      return { edits: [], contentHash: null };
     }
 
     try {
@@ -112,7 +116,8 @@ class DeprivacyPopup {
         },
         body: JSON.stringify({
           text: text,
-          epsilon: 5.0
+          epsilon: 5.0,
+          response_mode: 'edits'
         }),
       });
 
@@ -126,7 +131,7 @@ class DeprivacyPopup {
         throw new Error(result.error || 'Backend processing failed');
       }
 
-      return result.processed_text || text;
+      return { edits: result.edits || [], contentHash: result.content_hash };
 
     } catch (error) {
       console.error('Backend processing error:', error);